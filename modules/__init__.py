@@ -22,9 +22,35 @@ def load_layout_engine(cfg: dict):
         engine = DiTLayout()
         engine.init(cfg)
         return engine
+    elif cfg['type'] == 'dit_onnx':
+        from .layout.dit_onnx import DiTONNXLayout
+        engine = DiTONNXLayout()
+        engine.init(cfg)
+        return engine
+    elif cfg['type'] == 'geometry':
+        from .layout.geometry import GeometryLayout
+        engine = GeometryLayout()
+        engine.init(cfg)
+        return engine
     
     raise("unknown layout engine")
 
+def select_layout_type(cfg: dict, pdf_path=None, p_from: int = 0, p_to: int = None, layout_type: str = None) -> str:
+    """
+    Layout engine of a job: `layout_type` if given, else the configured one.
+    "auto" (or `auto_geometry` in the config) uses the geometry engine for
+    PDFs with a text layer on the pages [p_from, p_to).
+    """
+    if layout_type is None:
+        layout_type = 'auto' if cfg.get('auto_geometry') else cfg['type']
+    if layout_type != 'auto':
+        return layout_type
+    if pdf_path is not None:
+        from .ocr.text_layer import TextLayerExtractor
+        if TextLayerExtractor().has_text_layer(pdf_path, p_from, p_to):
+            return 'geometry'
+    return cfg['type'] if cfg['type'] not in ('auto', 'geometry') else 'dit'
+
 def load_ocr_engine(cfg: dict):
     if cfg['type'] == 'paddle':
         from .ocr.paddle import PaddleOCR
@@ -20,3 +20,26 @@ class LayoutBase(ABC):
         This method needs to be implemented by subclasses.
         """
         pass
+
+
+    def set_document(self, pdf_path, p_from: int = 0):
+        """
+        Set the PDF the next pages given to get_layouts come from, starting at
+        page p_from. Only used by the engines reading the PDF itself.
+        """
+        pass
+
+
+    def get_layouts(self, images) -> list:
+        """
+        Get the layout of several page images.
+
+        Parameters:
+        - images (list): The page images.
+
+        Returns:
+        - list: The list of Layout of each page.
+
+        Engines that can analyze several pages at once override this method.
+        """
+        return [self.get_single_layout(image) for image in images]
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import sqlite3
+import time
+from typing import Callable
+import numpy as np
+from loguru import logger
+from utils.layout_model import Layout
+
+# layout settings that do not change the detected boxes
+RUNTIME_KEYS = ("cache", "batch_size", "num_threads", "channels_last")
+
+
+class LayoutCache:
+    """
+    Persistent cache of the layout of page images.
+
+    Re-translating a document to another language or re-rendering it gives
+    the same page rasters: their (bbox, type, score) lists are stored in a
+    sqlite database, keyed by a hash of the raster, of the layout settings
+    and of the DPI. Only the `max_entries` most recently used pages are kept.
+    """
+
+    def __init__(self, config: dict, path: str = "layout_cache.db", max_entries: int = 10000):
+        self.max_entries = max_entries
+        settings = {key: value for key, value in config.items() if key not in RUNTIME_KEYS}
+        self.config_key = json.dumps(settings, sort_keys=True, default=str)
+        self.hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS layout_cache "
+            "(key TEXT PRIMARY KEY, value TEXT, last_used REAL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS layout_cache_last_used ON layout_cache (last_used)"
+        )
+        self._db.commit()
+
+    def key(self, image: np.ndarray) -> str:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(self.config_key.encode())
+        h.update(str(image.shape).encode())
+        h.update(np.ascontiguousarray(image).tobytes())
+        return h.hexdigest()
+
+    def get(self, key: str) -> list | None:
+        """The cached [bbox, type, score] of the page, None on a miss."""
+        row = self._db.execute("SELECT value FROM layout_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._db.execute("UPDATE layout_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        self._db.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, layouts: list[Layout]):
+        value = [
+            [np.asarray(layout.bbox).tolist(), layout.type, float(layout.score)]
+            for layout in layouts
+        ]
+        self._db.execute(
+            "INSERT OR REPLACE INTO layout_cache (key, value, last_used) VALUES (?, ?, ?)",
+            (key, json.dumps(value), time.time()),
+        )
+        # least recently used pages first
+        self._db.execute(
+            "DELETE FROM layout_cache WHERE key IN (SELECT key FROM layout_cache "
+            "ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        self._db.commit()
+
+    def get_layouts(
+        self, images: list, get_layouts: Callable[[list], list]
+    ) -> list[list[Layout]]:
+        """
+        Layouts of the pages, `get_layouts` is only called for the pages
+        missing from the cache.
+        """
+        images = [np.array(image, dtype=np.uint8) for image in images]
+        keys = [self.key(image) for image in images]
+        results = [None] * len(images)
+        missing = []
+        for i, key in enumerate(keys):
+            entries = self.get(key)
+            if entries is None:
+                missing.append(i)
+                continue
+            results[i] = []
+            for bbox, layout_type, score in entries:
+                layout = Layout(type=layout_type, bbox=np.array(bbox), score=score)
+                x1, y1, x2, y2 = layout.bbox
+                layout.image = images[i][int(y1) : int(y2), int(x1) : int(x2)]
+                results[i].append(layout)
+        if missing:
+            for i, layouts in zip(missing, get_layouts([images[i] for i in missing])):
+                self.put(keys[i], layouts)
+                results[i] = layouts
+        return results
+
+    def log_stats(self):
+        lookups = self.hits + self.misses
+        if lookups:
+            logger.info(f"Layout cache: {self.hits} hits / {lookups} ({self.hits / lookups:.1%})")
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,18 @@
+from pathlib import Path
+from .ditod import DiTLayout
+from utils.layout_onnx import ONNXLayoutAnalyzer
+
+
+class DiTONNXLayout(DiTLayout):
+    """DiT layout model run by onnxruntime, see `python -m utils.layout_export`."""
+
+    def init(self, cfg: dict):
+        self.batch_size = 1
+        self.layout_model = ONNXLayoutAnalyzer(
+            model_path=Path(cfg.get('onnx_model_path', "models/unilm/publaynet_dit-b_cascade.onnx")),
+            num_threads=cfg.get('num_threads'),
+        )
+
+        self.DPI = cfg['DPI'] if 'DPI' in cfg else 200
+        self._set_raster(cfg)
+        self._set_suppression(cfg)
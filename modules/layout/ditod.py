@@ -1,5 +1,4 @@
 import cv2
-import torch
 import numpy as np
 from tqdm import tqdm
 from pathlib import Path
@@ -9,11 +8,35 @@ from utils import LayoutAnalyzer
 
 class DiTLayout(LayoutBase):
     def init(self, cfg: dict):
+        # pages per forward pass of get_layouts, limited by the available memory
+        self.batch_size = cfg.get('batch_size', 1)
+        # precision: fp32 / bf16 / int8, see `python -m utils.layout_benchmark`
         self.layout_model = LayoutAnalyzer(
-            model_root_dir= Path("models/unilm"), device=cfg['device']
+            model_root_dir= Path("models/unilm"), device=cfg['device'], batch_size=self.batch_size,
+            precision=cfg.get('precision', 'fp32'), num_threads=cfg.get('num_threads'),
+            channels_last=cfg.get('channels_last', False),
         )
 
         self.DPI = cfg['DPI'] if 'DPI' in cfg else 200
+        self._set_raster(cfg)
+        self._set_suppression(cfg)
+
+    def _set_raster(self, cfg: dict):
+        # the layout model runs on a raster of raster.dpi / raster.max_side
+        # instead of the OCR one, the boxes are mapped back to the OCR raster
+        raster = cfg.get('raster', {})
+        scale = raster['dpi'] / self.DPI if 'dpi' in raster else 1.0
+        self.layout_model.set_raster(scale, raster.get('max_side'))
+
+    def _set_suppression(self, cfg: dict):
+        # duplicate boxes of the model, `suppression: false` keeps them all
+        suppression = cfg.get('suppression', {})
+        if suppression is False:
+            self.layout_model.set_suppression(None, None)
+        else:
+            self.layout_model.set_suppression(
+                suppression.get('iou', 0.5), suppression.get('containment', 0.9)
+            )
  
     def get_layout(self, pdf_path_or_bytes: str, p_from, p_to) -> str:
         
@@ -39,4 +62,8 @@ class DiTLayout(LayoutBase):
         # NOTE: delete RGB2BGR operation
         result = self.layout_model(img) 
         return result
-                
\ No newline at end of file
+
+    def get_layouts(self, images) -> list:
+        """Layouts of several pages, analyzed `batch_size` pages at a time."""
+        imgs = [np.array(image, dtype=np.uint8) for image in images]
+        return self.layout_model.batch(imgs)
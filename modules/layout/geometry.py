@@ -0,0 +1,172 @@
+import re
+from collections import Counter
+from pathlib import Path
+import numpy as np
+import pymupdf
+from pdf2image import convert_from_bytes, convert_from_path
+from .base import LayoutBase
+from ..ocr.paddle import TEXT_TYPES
+from ..ocr.text_layer import TextLayerExtractor, image_rects, is_full_page
+from utils.layout_model import Layout
+
+# first line of a list item: bullet, "1.", "(a)", "iv)"...
+_LIST_ITEM = re.compile(
+    r"^\s*([•·●○■□▪◦‣⁃∙◆➢✓*\-–—]"
+    r"|\(?\d{1,3}[.)]|\(?[a-zA-Z][.)]|\(?[ivxIVX]{1,4}[.)])\s"
+)
+
+
+class GeometryLayout(LayoutBase):
+    """
+    Layout of born-digital PDFs read from their text layer instead of
+    detected on the raster.
+
+    Text blocks come from the text layer, the blocks of bigger or bold
+    short text are titles and the ones starting with a bullet / number are
+    lists. Tables are found from the ruling lines and text alignment, and
+    the images placed on the page, except the full-page ones, are figures.
+    The text of the blocks is filled from the text layer too, only the
+    blocks with unmapped glyphs are left to OCR.
+    """
+
+    def init(self, cfg: dict):
+        self.DPI = cfg['DPI'] if 'DPI' in cfg else 200
+        geometry = cfg.get('geometry', {})
+        # size of the title font relative to the most used font of the page
+        self.title_size_ratio = geometry.get('title_size_ratio', 1.15)
+        self.max_title_lines = geometry.get('max_title_lines', 3)
+        # smallest image kept as a figure, in PDF points^2
+        self.min_figure_area = geometry.get('min_figure_area', 2500)
+        self.find_tables = geometry.get('find_tables', True)
+        self.text_layer = TextLayerExtractor(self.DPI)
+        self.pdf_path = None
+        self.page_index = 0
+
+    def set_document(self, pdf_path: Path, p_from: int = 0):
+        self.pdf_path = pdf_path
+        self.page_index = p_from
+
+    def get_layout(self, pdf_path_or_bytes, p_from, p_to):
+        if isinstance(pdf_path_or_bytes, Path):
+            pdf_images = convert_from_path(pdf_path_or_bytes, dpi=self.DPI)
+        else:
+            pdf_images = convert_from_bytes(pdf_path_or_bytes, dpi=self.DPI)
+        end = len(pdf_images) if p_to == 0 else p_to + 1
+        images = pdf_images[p_from:end]
+        self.set_document(pdf_path_or_bytes, p_from)
+        return self.get_layouts(images), images
+
+    def get_single_layout(self, image):
+        """Layout of the next page of the document."""
+        return self.get_layouts([image])[0]
+
+    def get_layouts(self, images) -> list:
+        if self.pdf_path is None:
+            raise ValueError("The geometry layout engine needs the PDF, call set_document first")
+        if isinstance(self.pdf_path, (str, Path)):
+            doc = pymupdf.open(self.pdf_path)
+        else:
+            doc = pymupdf.open(stream=self.pdf_path, filetype="pdf")
+        with doc:
+            results = []
+            for image in images:
+                results.append(self.get_page_layout(doc[self.page_index], image))
+                self.page_index += 1
+        return results
+
+    def get_page_layout(self, page: pymupdf.Page, image) -> list[Layout]:
+        image = np.array(image, dtype=np.uint8)
+        # the raster is rendered with the page rotation applied
+        matrix = page.rotation_matrix * pymupdf.Matrix(self.DPI / 72, self.DPI / 72)
+        blocks = []
+        if self.find_tables:
+            for table in page.find_tables().tables:
+                blocks.append(("table", pymupdf.Rect(table.bbox), None, None))
+        # images covering the page are scans / backgrounds, their text is on top
+        for rect in image_rects(page):
+            if rect.get_area() >= self.min_figure_area and not is_full_page(rect, page):
+                blocks.append(("figure", rect, None, None))
+        # text inside tables / figures belongs to them
+        occupied = [rect for _, rect, _, _ in blocks]
+        blocks.extend(self._text_blocks(page, occupied))
+
+        layouts = []
+        height, width = image.shape[:2]
+        for layout_type, rect, text, line_cnt in blocks:
+            rect = rect * matrix
+            bbox = np.array([rect.x0, rect.y0, rect.x1, rect.y1]).round().astype(int)
+            bbox[0::2] = bbox[0::2].clip(0, width)
+            bbox[1::2] = bbox[1::2].clip(0, height)
+            if bbox[2] <= bbox[0] or bbox[3] <= bbox[1]:
+                continue
+            layout = Layout(type=layout_type, bbox=bbox, score=1.0)
+            layout.image = image[bbox[1] : bbox[3], bbox[0] : bbox[2]]
+            if layout_type in TEXT_TYPES and self.text_layer.is_usable(text):
+                layout.text = text
+                layout.line_cnt = line_cnt
+            layouts.append(layout)
+        # reading order
+        layouts.sort(key=lambda layout: (layout.bbox[1], layout.bbox[0]))
+        return layouts
+
+    def _text_blocks(self, page: pymupdf.Page, occupied: list) -> list[tuple]:
+        """(type, rect, text, line count) of the text blocks of the page."""
+        blocks = []
+        sizes = Counter()
+        for block in page.get_text("dict", flags=pymupdf.TEXTFLAGS_TEXT)["blocks"]:
+            if block["type"] != 0:
+                continue
+            rect = pymupdf.Rect(block["bbox"])
+            if any((rect & other).get_area() > 0.5 * rect.get_area() for other in occupied):
+                continue
+            lines, block_sizes, bold = [], Counter(), True
+            for line in block["lines"]:
+                text = "".join(span["text"] for span in line["spans"]).strip()
+                if not text:
+                    continue
+                lines.append(text)
+                for span in line["spans"]:
+                    n_chars = len(span["text"].strip())
+                    block_sizes[round(span["size"], 1)] += n_chars
+                    if n_chars and not span["flags"] & pymupdf.TEXT_FONT_BOLD:
+                        bold = False
+            if not lines:
+                continue
+            sizes.update(block_sizes)
+            blocks.append((rect, lines, block_sizes.most_common(1)[0][0], bold))
+        if not blocks:
+            return []
+        body_size = sizes.most_common(1)[0][0]
+
+        typed = []
+        for rect, lines, size, bold in blocks:
+            text = " ".join(lines)
+            if _LIST_ITEM.match(lines[0]):
+                layout_type = "list"
+            elif len(lines) <= self.max_title_lines and (
+                size >= body_size * self.title_size_ratio or (bold and size >= body_size)
+            ):
+                layout_type = "title"
+            else:
+                layout_type = "text"
+            typed.append([layout_type, rect, text, len(lines), size])
+        return [block[:4] for block in self._merge_lists(typed)]
+
+    def _merge_lists(self, blocks: list[list]) -> list[list]:
+        """
+        Merge the consecutive items of a list into one block, like the
+        layout model finds them.
+        """
+        merged = []
+        for block in blocks:
+            if merged and block[0] == "list" and merged[-1][0] == "list":
+                prev = merged[-1]
+                gap = block[1].y0 - prev[1].y1
+                overlap = min(block[1].x1, prev[1].x1) - max(block[1].x0, prev[1].x0)
+                if -block[4] <= gap <= block[4] * 1.5 and overlap > 0:
+                    prev[1] = prev[1] | block[1]
+                    prev[2] = f"{prev[2]} {block[2]}"
+                    prev[3] += block[3]
+                    continue
+            merged.append(list(block))
+        return merged
@@ -23,7 +23,7 @@ class OCRBase(ABC):
 
 
     @abstractmethod
-    def get_all_text(self, layout):
+    def get_all_text(self, layout, image=None):
         """
         Translates a given string into another language.
 
@@ -37,3 +37,9 @@ class OCRBase(ABC):
         """
         pass
 
+
+    def close(self):
+        """
+        Release the resources (worker processes...) of the engine.
+        """
+        pass
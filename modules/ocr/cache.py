@@ -0,0 +1,214 @@
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Lock
+import cv2
+import numpy as np
+from loguru import logger
+
+
+class OCRCache:
+    """
+    LRU cache of OCR results keyed by a hash of the block image.
+
+    Running headers, footers, logos and repeated equations give the same
+    crop on every page. With `mode="exact"` the key is a hash of the raw
+    pixels. With `mode="perceptual"` the key is a small binarized thumbnail
+    of the image, and a lookup also matches the cached thumbnails of the
+    same size that differ by at most `max_distance` of their bits, so that
+    crops differing only by anti-aliasing / sub-pixel placement share the
+    result. Small text changes (e.g. a page number) can match in this mode,
+    only enable it for documents where that does not matter.
+
+    Keys contain `model_version`, so results of other models or OCR
+    settings are never reused. With a `path` the results are also stored in
+    a sqlite database and survive restarts, the `max_disk_entries` most
+    recently used ones are kept. Only the `max_entries` in memory are
+    indexed for the perceptual lookup, the thumbnails of a bucket on disk
+    are read per lookup.
+    """
+
+    def __init__(
+        self,
+        model_version: str,
+        max_entries: int = 4096,
+        path: str | None = None,
+        mode: str = "exact",
+        max_distance: float = 0.02,
+        thumbnail_height: int = 16,
+        max_disk_entries: int = 100000,
+    ):
+        if mode not in ("exact", "perceptual"):
+            raise ValueError(f"Unknown OCR cache mode: {mode}")
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.mode = mode
+        self.max_distance = max_distance
+        self.thumbnail_height = thumbnail_height
+        self._entries = OrderedDict()
+        # perceptual mode: size bucket -> {key: packed thumbnail bits} of the
+        # entries in memory
+        self._index: dict[str, dict[str, np.ndarray]] = {}
+        self._lock = Lock()
+        self.hits = {"memory": 0, "disk": 0, "near": 0}
+        self.misses = 0
+        self.evictions = 0
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS ocr_cache "
+                "(key TEXT PRIMARY KEY, bucket TEXT, value TEXT, last_used REAL)"
+            )
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(ocr_cache)")]
+            if "last_used" not in columns:
+                # database of an earlier version
+                self._db.execute("ALTER TABLE ocr_cache ADD COLUMN last_used REAL DEFAULT 0")
+            self._db.execute("CREATE INDEX IF NOT EXISTS ocr_cache_bucket ON ocr_cache (bucket)")
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS ocr_cache_last_used ON ocr_cache (last_used)"
+            )
+            self._db.commit()
+
+    def key(self, image: np.ndarray) -> str:
+        image = np.ascontiguousarray(image)
+        if self.mode == "perceptual":
+            bucket, bits = self._thumbnail(image)
+            return f"{bucket}:{bits.tobytes().hex()}"
+        h = hashlib.blake2b(digest_size=16)
+        h.update(self.model_version.encode())
+        h.update(str(image.shape).encode())
+        h.update(image.tobytes())
+        return h.hexdigest()
+
+    def _thumbnail(self, image: np.ndarray) -> tuple[str, np.ndarray]:
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        # images of the same bucket get thumbnails of the same size
+        height, width = gray.shape[0] // 8 + 1, gray.shape[1] // 8 + 1
+        thumb_w = max(1, min(8 * self.thumbnail_height, round(self.thumbnail_height * width / height)))
+        thumb = cv2.resize(gray, (thumb_w, self.thumbnail_height), interpolation=cv2.INTER_AREA)
+        _, thumb = cv2.threshold(thumb, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        bucket = f"{self.model_version}:{height}x{width}"
+        return bucket, np.packbits(thumb)
+
+    def _split(self, key: str) -> tuple[str, np.ndarray]:
+        bucket, bits = key.rsplit(":", 1)
+        return bucket, np.frombuffer(bytes.fromhex(bits), dtype=np.uint8)
+
+    def get(self, key: str):
+        """Return the cached (boxes, rec_res) of the key, None on a miss."""
+        with self._lock:
+            value = self._get(key)
+            if value is None and self.mode == "perceptual":
+                near = self._nearest(*self._split(key))
+                if near is not None:
+                    value = self._get(near)
+                    if value is not None:
+                        self.hits["near"] += 1
+            if value is None:
+                self.misses += 1
+            return value
+
+    def _get(self, key: str):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits["memory"] += 1
+            return self._entries[key]
+        if self._db is not None:
+            row = self._db.execute(
+                "SELECT value FROM ocr_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self.hits["disk"] += 1
+                self._db.execute(
+                    "UPDATE ocr_cache SET last_used = ? WHERE key = ?", (time.time(), key)
+                )
+                self._db.commit()
+                value = tuple(json.loads(row[0]))
+                self._insert(key, value)
+                return value
+        return None
+
+    def _nearest(self, bucket: str, bits: np.ndarray) -> str | None:
+        candidates = dict(self._index.get(bucket, {}))
+        if self._db is not None:
+            # read for this lookup only, the memory stays bounded by max_entries
+            rows = self._db.execute("SELECT key FROM ocr_cache WHERE bucket = ?", (bucket,))
+            for (key,) in rows:
+                if key not in candidates:
+                    candidates[key] = self._split(key)[1]
+        if not candidates:
+            return None
+        keys = list(candidates)
+        distance = np.unpackbits(np.stack(list(candidates.values())) ^ bits, axis=1).sum(axis=1)
+        best = int(np.argmin(distance))
+        if distance[best] > self.max_distance * 8 * len(bits):
+            return None
+        return keys[best]
+
+    def put(self, key: str, boxes, rec_res):
+        # plain lists, so that the cached value can not be modified through
+        # the arrays handed to the caller
+        boxes = [np.asarray(box).tolist() for box in boxes or []]
+        rec_res = [(text, float(score)) for text, score in rec_res or []]
+        value = (boxes, rec_res)
+        bucket = None
+        with self._lock:
+            self._insert(key, value)
+            if self.mode == "perceptual":
+                bucket, _ = self._split(key)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO ocr_cache (key, bucket, value, last_used) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, bucket, json.dumps(value, ensure_ascii=False), time.time()),
+                )
+                # least recently used results first
+                self._db.execute(
+                    "DELETE FROM ocr_cache WHERE key IN (SELECT key FROM ocr_cache "
+                    "ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,),
+                )
+                self._db.commit()
+        return value
+
+    def _insert(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if self.mode == "perceptual":
+            bucket, bits = self._split(key)
+            self._index.setdefault(bucket, {})[key] = bits
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self.evictions += 1
+            if self.mode == "perceptual":
+                # still found on disk with a path
+                bucket, _ = self._split(evicted)
+                self._index[bucket].pop(evicted, None)
+                if not self._index[bucket]:
+                    del self._index[bucket]
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.hits["memory"] + self.hits["disk"]
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": hits,
+                "disk_hits": self.hits["disk"],
+                "near_hits": self.hits["near"],
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": hits / lookups if lookups else None,
+            }
+
+    def log_stats(self):
+        stats = self.stats()
+        if stats["hit_rate"] is not None:
+            logger.info(
+                f"OCR cache: {stats['hits']} hits / {stats['hits'] + stats['misses']} "
+                f"({stats['hit_rate']:.1%}), {stats['entries']} entries"
+            )
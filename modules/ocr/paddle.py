@@ -2,39 +2,178 @@ import re
 import numpy as np
 from pathlib import Path
 from tqdm import tqdm
-from .base import OCRBase 
+from .base import OCRBase
+from .cache import OCRCache
+from .worker_pool import OCRWorkerPool
 from utils import OCRModel
 
+TEXT_TYPES = ["text", "list", "title"]
+
+
+def assign_lines_to_layouts(boxes, bboxes, min_overlap=0.5) -> np.ndarray:
+    """
+    Assign OCR lines detected on the whole page to layout boxes.
+
+    Parameters:
+    - boxes: The detected lines, quadrilaterals with shape (N, 4, 2).
+    - bboxes: The layout boxes (x1, y1, x2, y2), shape (M, 4).
+    - min_overlap: Minimum fraction of the line area inside the layout box.
+
+    Returns:
+    - np.ndarray: The index of the layout box of each line, -1 if none.
+    """
+    if len(boxes) == 0 or len(bboxes) == 0:
+        return np.full(len(boxes), -1, dtype=int)
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4, 2)
+    lines = np.concatenate([boxes.min(axis=1), boxes.max(axis=1)], axis=1)
+    bboxes = np.asarray(bboxes, dtype=np.float32).reshape(-1, 4)
+
+    # (N, M) intersection of each line with each layout box
+    iw = np.minimum(lines[:, None, 2], bboxes[None, :, 2]) - np.maximum(
+        lines[:, None, 0], bboxes[None, :, 0]
+    )
+    ih = np.minimum(lines[:, None, 3], bboxes[None, :, 3]) - np.maximum(
+        lines[:, None, 1], bboxes[None, :, 1]
+    )
+    inter = np.clip(iw, 0, None) * np.clip(ih, 0, None)
+    area = (lines[:, 2] - lines[:, 0]) * (lines[:, 3] - lines[:, 1])
+    overlap = inter / np.maximum(area, 1)[:, None]
+
+    owners = overlap.argmax(axis=1)
+    owners[overlap.max(axis=1) < min_overlap] = -1
+    return owners
+
+
 class PaddleOCR(OCRBase):
     def init(self, cfg: dict):
-        self.ocr_model = OCRModel(
-            model_root_dir= Path("models/paddle-ocr"), device=cfg['device']
-        )
- 
-    def get_all_text(self, layout) -> str:
-
-        for i, line in enumerate(layout):
-            if line.type in ["text", "list", "title"]:
-                # update this so image is created from images and layout bbox info
-                image = line.image
-                ocr_results = self.get_text(image)
-                text = list(map(lambda x: x[0],ocr_results[1]))
-                text = " ".join(text)
-                clean_text = re.sub(r"\n|\t", " ", text)
-                line.text = clean_text
-
-                lasty = 0
-                cnt = 0
-                for x in ocr_results[0]:
-                    if x[0][1] > lasty:
-                        cnt+=1
-                        lasty = x[2][1]
-
-                line.line_cnt = cnt
-
-
-        return layout
-    
+        # Run the detector once on the whole page instead of once per block
+        self.page_level = cfg.get('page_level', False)
+        parameters = {}
+        if self.page_level:
+            # the page raster must not be shrunk to the per-block default of 960
+            parameters['det_limit_side_len'] = cfg.get('page_det_limit_side_len', 2560)
+        # detector input size: "max" limits the longest side, "adaptive" also
+        # scales each block from the height of its text lines
+        det_resize = dict(cfg.get('det_resize', {}))
+        if det_resize.pop('type', 'max') == 'adaptive':
+            parameters['det_limit_type'] = 'adaptive'
+            for key, value in det_resize.items():
+                parameters[f'det_{key}'] = value
+        # the text lines of this many pages are recognized together
+        self.pages_per_batch = cfg.get('pages_per_batch', 4)
+        if 'rec_batch_num' in cfg:
+            parameters['rec_batch_num'] = cfg['rec_batch_num']
+        # onnxruntime session options: intra_op_num_threads, inter_op_num_threads,
+        # execution_mode, graph_optimization_level, optimized_model_dir
+        for key, value in cfg.get('onnxruntime', {}).items():
+            parameters[key if key == 'use_io_binding' else f'ort_{key}'] = value
+        # "int8" uses the models made by `python -m utils.ocr_model.quantize`
+        precision = cfg.get('precision', 'fp32')
+        if cfg.get('workers'):
+            # shard the blocks over worker processes with their own sessions
+            self.ocr_model = OCRWorkerPool(
+                model_root_dir=Path("models/paddle-ocr"), device=cfg['device'],
+                parameters=parameters, precision=precision, **cfg['workers'],
+            )
+        else:
+            self.ocr_model = OCRModel(
+                model_root_dir= Path("models/paddle-ocr"), device=cfg['device'], parameters=parameters,
+                precision=precision,
+            )
+        # cache of the results of repeated block images (headers, logos...)
+        self.cache = None
+        if cfg.get('cache'):
+            self.cache = OCRCache(self.ocr_model.version(), **cfg['cache'])
+
+    def get_all_text(self, layout, image=None) -> str:
+        return self.get_all_texts([layout], [image])[0]
+
+    def get_all_texts(self, layouts, images=None):
+        """
+        OCR the text blocks of several pages. The lines detected in all the
+        blocks (or pages in page level mode) of `pages_per_batch` pages are
+        recognized together in shared batches.
+        """
+        if images is None:
+            images = [None] * len(layouts)
+        for beg in range(0, len(layouts), self.pages_per_batch):
+            end = beg + self.pages_per_batch
+            self._get_texts(layouts[beg:end], images[beg:end])
+        if self.cache is not None:
+            self.cache.log_stats()
+        return layouts
+
+    def _get_texts(self, layouts, images):
+        jobs, job_images = [], []
+        for layout, image in zip(layouts, images):
+            text_layouts = [line for line in layout if line.type in TEXT_TYPES]
+            if not text_layouts:
+                continue
+            if self.page_level and image is not None:
+                # OCR the whole page at once and assign the lines to the
+                # layout boxes they overlap the most
+                jobs.append(text_layouts)
+                job_images.append(np.array(image, dtype=np.uint8))
+            else:
+                for line in text_layouts:
+                    jobs.append(line)
+                    job_images.append(line.image)
+
+        for job, (boxes, rec_res) in zip(jobs, self._ocr(job_images)):
+            if not isinstance(job, list):
+                self._set_text(job, boxes, rec_res)
+                continue
+            boxes, rec_res = boxes or [], rec_res or []
+            owners = assign_lines_to_layouts(boxes, [line.bbox for line in job])
+            for j, line in enumerate(job):
+                idx = np.flatnonzero(owners == j)
+                self._set_text(line, [boxes[k] for k in idx], [rec_res[k] for k in idx])
+
+    def _ocr(self, images):
+        """
+        (boxes, rec_res) of each image, the images found in the cache and
+        the duplicates among the others are only OCRed once.
+        """
+        if self.cache is None:
+            return self.ocr_model.ocr_batch(images)
+        results = [None] * len(images)
+        missing = {}
+        for i, image in enumerate(images):
+            key = self.cache.key(image)
+            results[i] = self.cache.get(key)
+            if results[i] is None:
+                missing.setdefault(key, []).append(i)
+        keys = list(missing)
+        ocr_results = self.ocr_model.ocr_batch([images[missing[key][0]] for key in keys])
+        for key, (boxes, rec_res) in zip(keys, ocr_results):
+            value = self.cache.put(key, boxes, rec_res)
+            for i in missing[key]:
+                results[i] = value
+        return results
+
+    def cache_stats(self) -> dict | None:
+        return None if self.cache is None else self.cache.stats()
+
+    def close(self):
+        if isinstance(self.ocr_model, OCRWorkerPool):
+            self.ocr_model.close()
+
+    def _set_text(self, line, boxes, rec_res):
+        text = list(map(lambda x: x[0], rec_res or []))
+        text = " ".join(text)
+        clean_text = re.sub(r"\n|\t", " ", text)
+        line.text = clean_text
+
+        lasty = 0
+        cnt = 0
+        for x in boxes or []:
+            if x[0][1] > lasty:
+                cnt+=1
+                lasty = x[2][1]
+
+        line.line_cnt = cnt
+
     def get_text(self, image):
-        return self.ocr_model(image)
-                
\ No newline at end of file
+        """(boxes, rec_res) of the image."""
+        return self._ocr([image])[0]
+
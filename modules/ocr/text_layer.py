@@ -0,0 +1,106 @@
+import re
+import numpy as np
+import pymupdf
+from pathlib import Path
+from .paddle import TEXT_TYPES, assign_lines_to_layouts
+
+# glyphs without a unicode mapping are extracted as U+FFFD or "(cid:123)"
+_UNMAPPED = re.compile(r"�|\(cid:\d+\)")
+# an image covering this share of the page is a scan (under an OCR text
+# layer) or a background, not a figure
+FULL_PAGE_IMAGE_RATIO = 0.8
+
+
+def image_rects(page: pymupdf.Page) -> list[pymupdf.Rect]:
+    """
+    Boxes of the images drawn on the page, clipped to it, in unrotated page
+    coordinates like the text.
+    """
+    page_rect = page.rect * page.derotation_matrix
+    rects = [pymupdf.Rect(info["bbox"]) & page_rect for info in page.get_image_info()]
+    return [rect for rect in rects if not rect.is_empty]
+
+
+def is_full_page(rect: pymupdf.Rect, page: pymupdf.Page, ratio: float = FULL_PAGE_IMAGE_RATIO) -> bool:
+    return rect.get_area() >= ratio * page.rect.get_area()
+
+
+class TextLayerExtractor:
+    """
+    Read the text of born-digital PDFs from their embedded text layer.
+
+    The words of the page are mapped to the layout boxes (found on the page
+    raster rendered at `DPI`) by overlap. Blocks that get no words, or
+    mostly unmapped glyphs, keep `text = None` and are left to OCR.
+    """
+
+    def __init__(self, DPI: int = 200, max_unmapped_ratio: float = 0.1):
+        self.DPI = DPI
+        self.max_unmapped_ratio = max_unmapped_ratio
+
+    def get_words(self, page: pymupdf.Page) -> tuple[np.ndarray, list[str], list[tuple]]:
+        """
+        Get the words of a page with their boxes in raster pixels and the
+        (block, line) they belong to, in content order.
+        """
+        # the raster is rendered with the page rotation applied
+        matrix = page.rotation_matrix * pymupdf.Matrix(self.DPI / 72, self.DPI / 72)
+        rects, words, lines = [], [], []
+        for x0, y0, x1, y1, word, block_no, line_no, _ in page.get_text("words"):
+            rect = pymupdf.Rect(x0, y0, x1, y1) * matrix
+            rects.append([[rect.x0, rect.y0], [rect.x1, rect.y0], [rect.x1, rect.y1], [rect.x0, rect.y1]])
+            words.append(word)
+            lines.append((block_no, line_no))
+        return np.array(rects, dtype=np.float32).reshape(-1, 4, 2), words, lines
+
+    def is_usable(self, text: str) -> bool:
+        unmapped = sum(len(m) for m in _UNMAPPED.findall(text))
+        return unmapped <= self.max_unmapped_ratio * len(text)
+
+    def get_page_text(self, layout, page: pymupdf.Page):
+        text_layouts = [line for line in layout if line.type in TEXT_TYPES]
+        if not text_layouts:
+            return layout
+        rects, words, lines = self.get_words(page)
+        if not words:
+            # scanned page, no text layer
+            return layout
+        owners = assign_lines_to_layouts(rects, [line.bbox for line in text_layouts])
+        for j, line in enumerate(text_layouts):
+            idx = np.flatnonzero(owners == j)
+            if len(idx) == 0:
+                continue
+            text = " ".join(words[k] for k in idx)
+            if not self.is_usable(text):
+                continue
+            line.text = text
+            line.line_cnt = len(set(lines[k] for k in idx))
+        return layout
+
+    def has_text_layer(self, pdf_path: Path, p_from: int = 0, p_to: int = None, min_chars: int = 20) -> bool:
+        """
+        Whether every page in [p_from, p_to) has a usable text layer, i.e.
+        the PDF is born-digital. The text of scanned pages made searchable
+        by OCR lies on a full-page image, these pages do not count.
+        """
+        with pymupdf.open(pdf_path) as doc:
+            for page in doc.pages(p_from, p_to):
+                text = page.get_text().strip()
+                if len(text) < min_chars or not self.is_usable(text):
+                    return False
+                if any(is_full_page(rect, page) for rect in image_rects(page)):
+                    return False
+        return True
+
+    def get_all_texts(self, layouts, pdf_path: Path, p_from: int = 0):
+        """
+        Fill the text of the layouts of pages p_from, p_from + 1... of the
+        PDF from its text layer.
+
+        Returns:
+        - the layouts, blocks without a usable text layer have `text = None`
+        """
+        with pymupdf.open(pdf_path) as doc:
+            for i, layout in enumerate(layouts):
+                self.get_page_text(layout, doc[p_from + i])
+        return layouts
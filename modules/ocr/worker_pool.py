@@ -0,0 +1,153 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+import numpy as np
+from loguru import logger
+
+# OCR model of the worker process, made once by _init_worker
+_worker_model = None
+
+
+def _init_worker(model_root_dir: Path, device: str, parameters: dict, precision: str, threads: int):
+    global _worker_model
+    import cv2
+    from utils.ocr_model.ocr_model import OCRModel
+
+    # the pool gives the parallelism, each worker only uses a few threads
+    cv2.setNumThreads(threads)
+    parameters = {
+        **parameters,
+        "ort_intra_op_num_threads": threads,
+        "ort_inter_op_num_threads": 1,
+    }
+    _worker_model = OCRModel(model_root_dir, device, parameters=parameters, precision=precision)
+
+
+def _worker_version() -> str:
+    return _worker_model.version()
+
+
+def _attach(name: str) -> SharedMemory:
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        # python < 3.13 registers attached blocks too, the parent unlinks it
+        shm = SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def _worker_ocr(shm_name: str, specs: list[tuple]) -> list:
+    shm = _attach(shm_name)
+    images = [
+        np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+        for offset, shape, dtype in specs
+    ]
+    try:
+        results = _worker_model.ocr_batch(images)
+    except Exception as e:
+        # the frames of the traceback hold crops of the images, they would
+        # keep the block exported and make close() hide the OCR error
+        e.__traceback__ = None
+        del images
+        _close(shm)
+        raise
+    results = [
+        (None if boxes is None else [np.array(box) for box in boxes], rec_res)
+        for boxes, rec_res in results
+    ]
+    # the crops are views of the images, they must be gone before close
+    del images
+    _close(shm)
+    return results
+
+
+def _close(shm: SharedMemory):
+    try:
+        shm.close()
+    except BufferError as e:
+        # views still alive, the block is released when they go
+        logger.warning(f"Could not close the shared memory block {shm.name}: {e}")
+
+
+class OCRWorkerPool:
+    """
+    Run OCR in a pool of worker processes.
+
+    Each worker holds its own warm detector / recognizer sessions limited
+    to `threads` threads, so that small crops keep every core busy instead
+    of leaving most of them idle in onnxruntime's intra-op parallelism.
+    The images of a call are copied once into a shared memory block and the
+    workers read them in place, only the (small) results are pickled.
+    Work is split in contiguous chunks of about the same number of pixels,
+    `chunks_per_worker` per worker to balance uneven blocks. The pool lives
+    as long as the OCR engine, the server keeps it across jobs.
+    """
+
+    def __init__(
+        self,
+        model_root_dir: Path,
+        device: str = "cpu",
+        parameters: dict = None,
+        precision: str = "fp32",
+        num_workers: int = None,
+        threads: int = 1,
+        chunks_per_worker: int = 2,
+    ):
+        self.num_workers = num_workers or max(1, multiprocessing.cpu_count() // threads)
+        self.chunks_per_worker = chunks_per_worker
+        # onnxruntime's thread pools do not survive a fork. Spawned workers
+        # import the main module again, it must not load models at import
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_root_dir, device, parameters or {}, precision, threads),
+        )
+        self._version = None
+        logger.info(f"Started {self.num_workers} OCR workers with {threads} thread(s) each")
+
+    def version(self) -> str:
+        if self._version is None:
+            self._version = self.executor.submit(_worker_version).result()
+        return self._version
+
+    def _chunks(self, images: list[np.ndarray]) -> list[np.ndarray]:
+        n_chunks = min(len(images), self.num_workers * self.chunks_per_worker)
+        pixels = np.cumsum([image.size for image in images])
+        bounds = np.searchsorted(pixels, pixels[-1] * np.arange(1, n_chunks) / n_chunks)
+        return [chunk for chunk in np.split(np.arange(len(images)), bounds) if len(chunk)]
+
+    def ocr_batch(self, images: list[np.ndarray]) -> list:
+        """
+        Same as OCRModel.ocr_batch, the images are OCRed by the workers.
+        """
+        if len(images) == 0:
+            return []
+        images = [np.asarray(image) for image in images]
+        offsets = np.cumsum([0] + [image.nbytes for image in images])
+        shm = SharedMemory(create=True, size=max(int(offsets[-1]), 1))
+        try:
+            specs = []
+            for image, offset in zip(images, offsets.tolist()):
+                view = np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf, offset=offset)
+                view[...] = image
+                specs.append((offset, image.shape, image.dtype.str))
+                del view
+
+            futures = [
+                self.executor.submit(_worker_ocr, shm.name, [specs[i] for i in chunk])
+                for chunk in self._chunks(images)
+            ]
+            results = []
+            for future in futures:
+                results.extend(future.result())
+            return results
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def close(self):
+        self.executor.shutdown()
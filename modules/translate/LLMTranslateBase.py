@@ -1,10 +1,15 @@
+import time
 from abc import ABC, abstractmethod
 from tqdm import tqdm
 from typing import List
 from utils.layout_model import Layout
 from threading import Thread
 from .base import TranslateBase
-from openai import OpenAI
+from .single_flight import SingleFlight
+from .concurrency import get_limiter, retry_delay
+from .routing import ModelRouter
+from .translation_memory import FuzzyTranslationMemory, TMMatch
+from openai import OpenAI, APIConnectionError, RateLimitError, InternalServerError
 from loguru import logger
 from textdistance import levenshtein
 
@@ -102,9 +107,28 @@ class LLMTranslateBase(TranslateBase):
     def init(self, cfg: dict):
         self.client: OpenAI = self.init_client(cfg)
         self.model = cfg["model"]
+        # Short / simple segments and classification calls go to the small model
+        self.router = ModelRouter(
+            self.model, cfg.get("small_model"), **cfg.get("routing", {})
+        )
         self.from_lang = None
         self.to_lang = None
         self.check_response = None
+        # Identical segments translated concurrently share one LLM call
+        self.single_flight = SingleFlight()
+        # In-flight requests are limited per endpoint and tuned with AIMD
+        self.limiter = get_limiter(
+            str(self.client.base_url), cfg.get("concurrency")
+        )
+        # attempts of a request failing with a non-transient error (bad
+        # request, auth...), overloads are retried until they pass
+        self.max_error_retries = cfg.get("max_error_retries", 3)
+        # Near-duplicates of already translated segments are reused / post-edited
+        self.translation_memory = None
+        if cfg.get("translation_memory") is not None:
+            self.translation_memory = FuzzyTranslationMemory(
+                **cfg["translation_memory"]
+            )
 
     @abstractmethod
     def init_client(self, cfg: dict) -> OpenAI:
@@ -113,15 +137,51 @@ class LLMTranslateBase(TranslateBase):
     def get_languages(self):
         return langs
 
-    def get_response(self, messages: list):
+    def get_response(self, messages: list, route: str = "large", classify: bool = False):
+        # the latency of yes / no classification calls says nothing about the
+        # load of the endpoint, only the translations of each route tune its limit
+        signal = None if classify else route
+        overloads, errors = 0, 0
         while True:
+            start = self.limiter.acquire()
             try:
                 response = self.client.chat.completions.create(
-                    model=self.model, messages=messages
+                    model=self.router.model(route), messages=messages
                 )
-                return response.choices[0].message.content
+            except (APIConnectionError, RateLimitError, InternalServerError) as e:
+                # timeouts, 429s and overloaded servers shrink the limit, and
+                # the request waits before it is retried
+                self.limiter.release(start, "overload")
+                delay = retry_delay(e, overloads)
+                overloads += 1
+                logger.warning(f"Failed to get response: {e}, retrying in {delay:.1f}s...")
+                time.sleep(delay)
+                continue
             except Exception as e:
-                logger.warning(f"Failed to get response: {e}, retrying...")
+                self.limiter.release(start, "error")
+                errors += 1
+                if errors >= self.max_error_retries:
+                    logger.error(f"Failed to get response: {e}, giving up after {errors} attempts")
+                    raise
+                delay = retry_delay(e, errors - 1)
+                logger.warning(f"Failed to get response: {e}, retrying in {delay:.1f}s...")
+                time.sleep(delay)
+                continue
+            self.limiter.release(start, signal=signal)
+            self.router.record(
+                route,
+                sum(len(m["content"]) for m in messages),
+                time.monotonic() - start,
+            )
+            return response.choices[0].message.content
+
+    def concurrency_stats(self) -> dict:
+        """Current in-flight limit, latency and throughput of the endpoint."""
+        return self.limiter.stats()
+
+    def routing_stats(self) -> dict:
+        """Calls, characters and average latency of each model route."""
+        return self.router.stats()
 
     def reformat_text(self, text):
         sys_prompt = """You are a text format checker now. The user will give you some reformatting tasks, you should just complete the task without any additional response. Return the result only."""
@@ -136,7 +196,8 @@ class LLMTranslateBase(TranslateBase):
                 [
                     {"role": "system", "content": sys_prompt},
                     {"role": "user", "content": prompt},
-                ]
+                ],
+                route=self.router.route_text(text),
             )
             _response = response.replace("\n", "")
             _text = text.replace("\n", "")
@@ -162,7 +223,9 @@ class LLMTranslateBase(TranslateBase):
             [
                 {"role": "system", "content": sys_prompt},
                 {"role": "user", "content": user_prompt},
-            ]
+            ],
+            route="small",
+            classify=True,
         )
         if "incorrect" in response:
             self.check_response = response
@@ -191,7 +254,7 @@ class LLMTranslateBase(TranslateBase):
                 "content": f"Please check if the following text is a reference or not, remember to answer 'yes' or 'no' first:\n\n{text}",
             },
         ]
-        response = self.get_response(prompts)
+        response = self.get_response(prompts, route="small", classify=True)
         if "yes" in response.lower():
             return True
         elif "no" in response.lower():
@@ -233,8 +296,26 @@ class LLMTranslateBase(TranslateBase):
         - str: The translated text.
         - None: If the translation failed or it should not be translated(eg. it is a reference).
 
-        This method needs to be implemented by subclasses.
+        Concurrent calls with the same (text, from_lang, to_lang, model) are
+        coalesced, only the first one reaches the LLM. If a translation memory
+        is configured, a near-identical segment translated before is reused,
+        and a similar one is given to the LLM to post-edit.
         """
+        match = None
+        if self.translation_memory is not None:
+            match = self.translation_memory.lookup(text, from_lang, to_lang)
+            if match is not None and match.exact:
+                logger.debug(f"Reusing the translation memory (score {match.score:.2f})")
+                return match.translation
+        model = self.router.model(self.router.route_text(text))
+        key = (text, from_lang, to_lang, model)
+        return self.single_flight.do(
+            key, lambda: self._translate(text, from_lang, to_lang, match)
+        )
+
+    def _translate(
+        self, text: str, from_lang: str, to_lang: str, match: TMMatch | None = None
+    ) -> str | None:
         self.from_lang = from_lang
         self.to_lang = to_lang
         check_time = 0
@@ -243,11 +324,18 @@ class LLMTranslateBase(TranslateBase):
             if self.check_response:
                 prompt = f"{base_prompt}You have translated once before, but the feedback of your translation is bad, the feedback is {self.check_response}. Pay attention to your translation later.\nHere is the text to translate, return the translation only:\n\n{text}"
                 self.check_response = None
+            elif match is not None:
+                prompt = f"{base_prompt}A similar text has been translated before, edit that translation so that it matches the new text exactly.\n<The similar text is> {match.source}\n<Its translation is> {match.translation}\nHere is the text to translate, return the translation only:\n\n{text}"
             else:
                 prompt = f"{base_prompt}Here is the text to translate, return the translation only:\n\n{text}"
-            translated_text = self.get_response([{"role": "user", "content": prompt}])
+            translated_text = self.get_response(
+                [{"role": "user", "content": prompt}],
+                route=self.router.route_text(text),
+            )
             logger.debug(f"Translated text: {translated_text}")
             if self.check_translation(text, translated_text):
+                if self.translation_memory is not None:
+                    self.translation_memory.add(text, from_lang, to_lang, translated_text)
                 return translated_text
             else:
                 logger.warning(
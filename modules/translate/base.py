@@ -3,6 +3,8 @@ from tqdm import tqdm
 from typing import List
 from utils.layout_model import Layout
 from threading import Thread
+from loguru import logger
+from .dedup import group_duplicate_layouts
 
 class TranslateBase(ABC):
     @abstractmethod
@@ -36,6 +38,30 @@ class TranslateBase(ABC):
                 t.join()
         return layout
 
+    def translate_document(self, pages: List[List[Layout]], from_lang, to_lang, multi_thread = False):
+        """
+        Translate all the pages of a document, translating each repeated
+        segment (headers, footers, journal names...) only once.
+
+        Parameters:
+        - pages (List[List[Layout]]): The layouts of every page.
+
+        Returns:
+        - List[List[Layout]]: The same pages with `translated_text` filled.
+        """
+        groups = group_duplicate_layouts(pages)
+        representatives = [group[0] for group in groups]
+        n_segments = sum(len(group) for group in groups)
+        logger.info(f"Translating {len(representatives)} unique segments out of {n_segments}")
+        self.translate_all(representatives, from_lang, to_lang, multi_thread=multi_thread)
+        for group in groups:
+            first = group[0]
+            for line in group[1:]:
+                # lists are reformatted before translation, share that as well
+                line.text = first.text
+                line.translated_text = first.translated_text
+        return pages
+
     @abstractmethod
     def reformat_text(self, text: str) -> str:
         pass
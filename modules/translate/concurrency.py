@@ -0,0 +1,176 @@
+import random
+import time
+from collections import deque
+from threading import Condition, Lock
+from loguru import logger
+
+
+class AIMDLimiter:
+    """
+    Adaptive limit on the number of in-flight requests to one LLM endpoint.
+
+    The limit grows additively (about `increase` per round of `limit`
+    successful requests) while latency stays close to its long-term
+    baseline, and is cut multiplicatively by `decrease` on overload
+    (timeouts, 429s, 5xx) or when a latency sample exceeds
+    `latency_tolerance` times the baseline. The baseline slowly follows
+    the observed latency, so the limit keeps tracking the best achievable
+    throughput when the backend capacity changes.
+
+    Requests of different kinds (models, short checks vs paragraph
+    translations) have different normal latencies: each `signal` has its own
+    baseline, and requests released without one do not move the limit.
+    """
+
+    def __init__(
+        self,
+        name: str = "",
+        initial_limit: float = 4,
+        min_limit: float = 1,
+        max_limit: float = 64,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_tolerance: float = 2.0,
+        window: float = 60.0,
+    ):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.window = window
+
+        self.in_flight = 0
+        self.latency = {}  # short-term EWMA per signal
+        self.baseline_latency = {}  # long-term EWMA per signal
+        self.successes = 0
+        self.overloads = 0
+        self.errors = 0
+        self._last_decrease = 0.0
+        self._completions = deque()
+        self._cond = Condition(Lock())
+
+    def acquire(self) -> float:
+        """Block until a slot is free, return the start time of the request."""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+        return time.monotonic()
+
+    def release(self, start: float, status: str = "ok", signal: str | None = "default"):
+        """
+        Free the slot taken by `acquire` and update the limit.
+
+        Parameters:
+        - start (float): The value returned by `acquire`.
+        - status (str): "ok", "overload" (timeout / rate limit / server busy)
+          or "error" (any other failure, does not change the limit).
+        - signal (str | None): The latency baseline the request is compared
+          to, None to not use its latency (e.g. classification calls).
+        """
+        now = time.monotonic()
+        latency = now - start
+        with self._cond:
+            self.in_flight -= 1
+            if status == "ok":
+                self.successes += 1
+                self._completions.append(now)
+                if signal is not None:
+                    self._on_latency(signal, latency, now)
+            elif status == "overload":
+                self.overloads += 1
+                self._backoff(now, "overload")
+            else:
+                self.errors += 1
+            self._cond.notify_all()
+
+    def _on_latency(self, signal: str, latency: float, now: float):
+        baseline = self.baseline_latency.get(signal)
+        if baseline is None:
+            self.latency[signal] = self.baseline_latency[signal] = latency
+            return
+        self.latency[signal] = 0.7 * self.latency[signal] + 0.3 * latency
+        spike = latency > self.latency_tolerance * baseline
+        # the baseline slowly follows lasting changes of the backend
+        self.baseline_latency[signal] = 0.95 * baseline + 0.05 * latency
+        if spike:
+            self._backoff(now, f"latency spike {latency:.2f}s")
+        else:
+            self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+
+    def _backoff(self, now: float, reason: str):
+        # requests already in flight when the limit was cut report the same
+        # congestion, only react once per round trip
+        cooldown = max(self.baseline_latency.values(), default=1.0)
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.decrease)
+        logger.debug(f"[{self.name}] {reason}, concurrency limit -> {self.limit:.1f}")
+
+    def throughput(self) -> float:
+        """Successful requests per second over the last `window` seconds."""
+        now = time.monotonic()
+        with self._cond:
+            while self._completions and now - self._completions[0] > self.window:
+                self._completions.popleft()
+            return len(self._completions) / self.window
+
+    def stats(self) -> dict:
+        throughput = self.throughput()
+        with self._cond:
+            return {
+                "endpoint": self.name,
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "latency": dict(self.latency),
+                "baseline_latency": dict(self.baseline_latency),
+                "throughput": throughput,
+                "successes": self.successes,
+                "overloads": self.overloads,
+                "errors": self.errors,
+            }
+
+
+def retry_delay(error: Exception, attempt: int, base: float = 1.0, max_delay: float = 60.0) -> float:
+    """
+    Seconds to wait before retrying a failed request: the Retry-After of the
+    response if the server sent one, else exponential backoff with full
+    jitter, so that the clients cut by the same overload do not retry in
+    lockstep.
+
+    Parameters:
+    - error (Exception): The error of the request, an openai APIStatusError
+      carries the HTTP response.
+    - attempt (int): Number of failed attempts before this one.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return min(max_delay, max(0.0, float(headers[header]) * scale))
+        except (KeyError, TypeError, ValueError):
+            # absent, or an HTTP date
+            pass
+    return random.uniform(0, min(max_delay, base * 2**attempt))
+
+
+_limiters: dict[str, AIMDLimiter] = {}
+_limiters_lock = Lock()
+
+
+def get_limiter(endpoint: str, cfg: dict | None = None) -> AIMDLimiter:
+    """Return the limiter shared by every translator talking to `endpoint`."""
+    with _limiters_lock:
+        if endpoint not in _limiters:
+            _limiters[endpoint] = AIMDLimiter(name=endpoint, **(cfg or {}))
+        return _limiters[endpoint]
+
+
+def all_limiter_stats() -> list[dict]:
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [limiter.stats() for limiter in limiters]
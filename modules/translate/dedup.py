@@ -0,0 +1,36 @@
+import re
+import unicodedata
+from typing import List
+from utils.layout_model import Layout
+
+_HYPHEN_BREAK = re.compile(r"(\w)- (\w)")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize OCR text so that repeated segments (running headers, journal
+    names, figure labels...) compare equal despite whitespace / unicode /
+    line-break hyphenation noise.
+    """
+    text = unicodedata.normalize("NFKC", text)
+    text = _SPACES.sub(" ", text).strip()
+    text = _HYPHEN_BREAK.sub(r"\1\2", text)
+    return text
+
+
+def group_duplicate_layouts(pages: List[List[Layout]]) -> List[List[Layout]]:
+    """
+    Group the text layouts of a whole document by their normalized text.
+
+    Returns one group per distinct segment, in order of first appearance.
+    The first layout of each group is the one that should be translated.
+    """
+    groups: dict[tuple, List[Layout]] = {}
+    for layouts in pages:
+        for line in layouts:
+            if not line.text:
+                continue
+            key = (line.type, normalize_text(line.text))
+            groups.setdefault(key, []).append(line)
+    return list(groups.values())
@@ -0,0 +1,66 @@
+import re
+from threading import Lock
+
+_LETTER = re.compile(r"[^\W\d_]")
+
+
+class ModelRouter:
+    """
+    Route LLM calls between a small fast model and the large one.
+
+    Classification-style calls (reference checks, translation validation)
+    always use the "small" route. Text is routed by length / complexity:
+    page numbers, "Table 2", one-word captions... go to the small model and
+    prose goes to the large one. Without a small model both routes use the
+    large model, but the per-route metrics are still collected.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        small_model: str | None = None,
+        max_small_chars: int = 60,
+        max_small_words: int = 6,
+        min_letter_ratio: float = 0.5,
+    ):
+        self.models = {"large": model, "small": small_model or model}
+        self.max_small_chars = max_small_chars
+        self.max_small_words = max_small_words
+        self.min_letter_ratio = min_letter_ratio
+        self._lock = Lock()
+        self._metrics = {
+            route: {"calls": 0, "chars": 0, "latency": 0.0} for route in self.models
+        }
+
+    def route_text(self, text: str) -> str:
+        text = text.strip()
+        if len(text) <= self.max_small_chars:
+            return "small"
+        if len(text.split()) <= self.max_small_words:
+            return "small"
+        # mostly numbers / symbols, e.g. table content or equations
+        if len(_LETTER.findall(text)) < self.min_letter_ratio * len(text):
+            return "small"
+        return "large"
+
+    def model(self, route: str) -> str:
+        return self.models[route]
+
+    def record(self, route: str, chars: int, latency: float):
+        with self._lock:
+            metrics = self._metrics[route]
+            metrics["calls"] += 1
+            metrics["chars"] += chars
+            metrics["latency"] += latency
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                route: {
+                    "model": self.models[route],
+                    "calls": m["calls"],
+                    "chars": m["chars"],
+                    "avg_latency": m["latency"] / m["calls"] if m["calls"] else None,
+                }
+                for route, m in self._metrics.items()
+            }
@@ -0,0 +1,155 @@
+import json
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+from threading import Lock
+from loguru import logger
+from textdistance import levenshtein
+from .dedup import normalize_text
+
+_DIGITS = re.compile(r"\d+")
+
+
+@dataclass
+class TMMatch:
+    score: float
+    source: str
+    translation: str
+    # True if the translation can be reused as is, otherwise it should only
+    # be used as a post-edit hint
+    exact: bool
+
+
+class FuzzyTranslationMemory:
+    """
+    Translation memory with near-duplicate lookup.
+
+    Previously translated segments are indexed by their character n-grams
+    (inverted index). A lookup returns the closest stored segment by Dice
+    similarity of the n-gram sets when it is above `post_edit_threshold`.
+    Matches above `reuse_threshold` whose numbers are unchanged and whose
+    normalized text differs by at most `max_reuse_distance` characters can
+    be reused directly: a high n-gram similarity alone does not catch an
+    added "not" in a long paragraph. The others are meant to be post-edited
+    by the LLM.
+    With a `path` the memory is persisted as JSON lines so that revised
+    versions of a manuscript benefit from earlier runs.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        n: int = 3,
+        reuse_threshold: float = 0.97,
+        post_edit_threshold: float = 0.75,
+        max_candidates: int = 20,
+        max_reuse_distance: int = 0,
+    ):
+        self.path = path
+        self.n = n
+        self.reuse_threshold = reuse_threshold
+        self.max_reuse_distance = max_reuse_distance
+        self.post_edit_threshold = post_edit_threshold
+        self.max_candidates = max_candidates
+        self._lock = Lock()
+        # (from_lang, to_lang) -> entries / n-gram postings
+        self._entries: dict[tuple, list[tuple[str, str, frozenset]]] = {}
+        self._index: dict[tuple, dict[str, list[int]]] = {}
+        self._keys: dict[tuple, dict[str, int]] = {}
+        self.hits = {"reuse": 0, "post_edit": 0, "miss": 0}
+        if path is not None and os.path.exists(path):
+            self._load(path)
+
+    def _normalize(self, text: str) -> str:
+        return normalize_text(text).casefold()
+
+    def _ngrams(self, text: str) -> frozenset:
+        text = f" {text} "
+        if len(text) <= self.n:
+            return frozenset([text])
+        return frozenset(text[i : i + self.n] for i in range(len(text) - self.n + 1))
+
+    def _load(self, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._add(item["source"], item["from_lang"], item["to_lang"], item["translation"])
+        logger.info(f"Loaded {sum(map(len, self._entries.values()))} segments from the translation memory")
+
+    def _add(self, text, from_lang, to_lang, translation):
+        pair = (from_lang, to_lang)
+        key = self._normalize(text)
+        keys = self._keys.setdefault(pair, {})
+        entries = self._entries.setdefault(pair, [])
+        if key in keys:
+            # keep the latest translation of the segment
+            i = keys[key]
+            entries[i] = (text, translation, entries[i][2])
+            return
+        grams = self._ngrams(key)
+        keys[key] = len(entries)
+        index = self._index.setdefault(pair, {})
+        for gram in grams:
+            index.setdefault(gram, []).append(len(entries))
+        entries.append((text, translation, grams))
+
+    def add(self, text: str, from_lang: str, to_lang: str, translation: str):
+        with self._lock:
+            self._add(text, from_lang, to_lang, translation)
+            if self.path is not None:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    item = {
+                        "source": text,
+                        "from_lang": from_lang,
+                        "to_lang": to_lang,
+                        "translation": translation,
+                    }
+                    f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+    def lookup(self, text: str, from_lang: str, to_lang: str) -> TMMatch | None:
+        pair = (from_lang, to_lang)
+        key = self._normalize(text)
+        grams = self._ngrams(key)
+        with self._lock:
+            index = self._index.get(pair, {})
+            entries = self._entries.get(pair, [])
+            shared = Counter()
+            for gram in grams:
+                shared.update(index.get(gram, ()))
+            best = None
+            for i, count in shared.most_common(self.max_candidates):
+                other = entries[i][2]
+                score = 2 * count / (len(grams) + len(other))
+                if best is None or score > best[0]:
+                    best = (score, i)
+            if best is None or best[0] < self.post_edit_threshold:
+                self.hits["miss"] += 1
+                return None
+            score, i = best
+            source, translation, _ = entries[i]
+            exact = (
+                score >= self.reuse_threshold
+                and _DIGITS.findall(source) == _DIGITS.findall(text)
+                and self._within_reuse_distance(source, text)
+            )
+            self.hits["reuse" if exact else "post_edit"] += 1
+        return TMMatch(score, source, translation, exact)
+
+    def _within_reuse_distance(self, source: str, text: str) -> bool:
+        source, text = normalize_text(source), normalize_text(text)
+        if source == text:
+            return True
+        if abs(len(source) - len(text)) > self.max_reuse_distance:
+            return False
+        return levenshtein.distance(source, text) <= self.max_reuse_distance
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "segments": sum(map(len, self._entries.values())),
+                **self.hits,
+            }
@@ -1,7 +1,6 @@
 import sys
 import os
 from threading import Thread
-from multiprocessing import Pool
 import tempfile
 from pathlib import Path
 from typing import List, Tuple, Union
@@ -23,7 +22,8 @@ from modules.render.reportlab import ReportLabRender
 from tqdm import tqdm
 import gradio as gr
 from loguru import logger
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from utils.layout_model import Layout
 from utils.database.file_db import FileDatabase, FileStatus
 from utils.api_utils import TranslateRequest
@@ -38,14 +38,28 @@ from modules import (
     load_translator,
     load_layout_engine,
     load_ocr_engine,
+    select_layout_type,
     load_render_engine,
 )
+from modules.ocr.paddle import TEXT_TYPES
+from modules.ocr.text_layer import TextLayerExtractor
+from modules.layout.cache import LayoutCache
 
 
 cfg = load_config("config.yaml", "config.dev.yaml")
-translator = load_translator(cfg["translator"])
-logger.info(f"Got translator {translator}")
-render_engine = load_render_engine(cfg["render"])
+# loaded by TranslateApi rather than at import: the spawned OCR workers
+# import this module again and must not load them
+translator = None
+render_engine = None
+
+
+def load_engines():
+    """Load the translator and the render engine of the server once"""
+    global translator, render_engine
+    if translator is None:
+        translator = load_translator(cfg["translator"])
+        logger.info(f"Got translator {translator}")
+        render_engine = load_render_engine(cfg["render"])
 
 
 class InputPdf(BaseModel):
@@ -53,13 +67,82 @@ class InputPdf(BaseModel):
 
     input_pdf: UploadFile = Field(..., title="Input PDF file")
 
-def layout_and_ocr_process(cfg: dict, pdf_images: list):
+def load_layout_cache(layout_cfg: dict):
+    """The layout cache of the config, None when disabled or for the geometry engine"""
+    if not layout_cfg.get("cache") or layout_cfg["type"] == "geometry":
+        return None
+    return LayoutCache(layout_cfg, **layout_cfg["cache"])
+
+
+# OCR engine of the process, kept across jobs with `keep_alive` so that its
+# onnxruntime sessions (and OCR worker processes) are only built once
+_ocr_engine = None
+
+
+def keep_alive(cfg: dict) -> bool:
+    """Whether the layout / OCR process and the OCR engine are kept across jobs.
+    `ocr.keep_alive` if set, else only when the layout and OCR run on CPU: on
+    GPU the process would hold its CUDA context and sessions during translation
+    """
+    if cfg["ocr"].get("keep_alive") is not None:
+        return cfg["ocr"]["keep_alive"]
+    return cfg["layout"].get("device") == "cpu" and cfg["ocr"].get("device") == "cpu"
+
+
+def get_ocr_engine(ocr_cfg: dict):
+    """The OCR engine of the process, loaded on the first call"""
+    global _ocr_engine
+    if _ocr_engine is None:
+        _ocr_engine = load_ocr_engine(ocr_cfg)
+    return _ocr_engine
+
+
+def close_ocr_engine():
+    """Release the OCR engine of the process (sessions, worker processes)"""
+    global _ocr_engine
+    if _ocr_engine is not None:
+        _ocr_engine.close()
+        _ocr_engine = None
+
+
+def fill_text_layer(
+    cfg: dict, layout_type: str, results: list, pdf_path: Path = None, p_from: int = 0, dpi: int = 200,
+) -> list:
+    """Read the text of born-digital PDFs from their text layer.
+    Input:
+        cfg: dict: Configurations, the text layer is read when `ocr.text_layer` is enabled
+        layout_type: str: The layout engine of the results, the geometry engine already read the text layer
+        results: list: The layouts of the pages
+        pdf_path: Path: The PDF file
+        p_from: int: The page index of the first layout
+        dpi: int: The DPI the pages were rendered at
+    Returns:
+        The blocks left to OCR for each page, `results` itself when the text layer is not used
+    """
+    geometry = layout_type == "geometry"
+    if not geometry and not (cfg["ocr"].get("text_layer") and pdf_path is not None):
+        return results
+    if not geometry:
+        TextLayerExtractor(dpi).get_all_texts(results, pdf_path, p_from)
+    return [
+        [line for line in result if line.type in TEXT_TYPES and line.text is None]
+        for result in results
+    ]
+
+
+def layout_and_ocr_process(
+    cfg: dict, pdf_images: list, pdf_path: Path = None, p_from: int = 0, dpi: int = 200,
+    layout_type: str = None,
+):
     """Process the layout and OCR for the PDF images.
     Restart the Ollama container if it is provided.(For lower vram usage)
     Input:
         cfg: dict: Configurations
         pdf_images: list: List of PDF images
-        ollama_container: str: Ollama container name
+        pdf_path: Path: The PDF file, its text layer is used instead of OCR when `ocr.text_layer` is enabled
+        p_from: int: The page index of the first image
+        dpi: int: The DPI the images were rendered at
+        layout_type: str: The layout engine of the job ("dit", "geometry", "auto"...), by default the configured one
     """
     if (
         cfg["translator"].get("restart_container") is not None
@@ -68,14 +151,35 @@ def layout_and_ocr_process(cfg: dict, pdf_images: list):
         ollama_container = cfg["translator"]["container_name"]
         logger.info(f"\tRestarting the Ollama container: {ollama_container}")
         os.system(f"docker restart {ollama_container}")
-    # Initialize the layout engine / OCR engine
-    layout_engine = load_layout_engine(cfg["layout"])
-    ocr_engine = load_ocr_engine(cfg["ocr"])
-    results = []
-    for i, image in tqdm(enumerate(pdf_images), desc="Getting layout and texts"):
-        result = layout_engine.get_single_layout(image)
-        result = ocr_engine.get_all_text(result)
-        results.append(result)
+    # Initialize the layout engine
+    layout_cfg = dict(cfg["layout"], DPI=dpi)
+    layout_cfg["type"] = select_layout_type(
+        layout_cfg, pdf_path, p_from, p_from + len(pdf_images), layout_type
+    )
+
+    def get_layouts(images):
+        layout_engine = load_layout_engine(layout_cfg)
+        layout_engine.set_document(pdf_path, p_from)
+        return layout_engine.get_layouts(images)
+
+    logger.info(f"\tGetting the layout of {len(pdf_images)} pages with {layout_cfg['type']}")
+    layout_cache = load_layout_cache(layout_cfg)
+    if layout_cache is None:
+        results = get_layouts(pdf_images)
+    else:
+        # the layout engine is only loaded for the pages missing from the cache
+        results = layout_cache.get_layouts(pdf_images, get_layouts)
+        layout_cache.log_stats()
+        layout_cache.close()
+
+    pending = fill_text_layer(cfg, layout_cfg["type"], results, pdf_path, p_from, dpi)
+    if pending is not results:
+        logger.info(f"\t{sum(map(len, pending))} blocks without text layer, OCR them")
+    if any(pending):
+        # OCR all the pages together so that text lines are recognized in full batches
+        get_ocr_engine(cfg["ocr"]).get_all_texts(pending, pdf_images)
+    if not keep_alive(cfg):
+        close_ocr_engine()
     return results
 
 
@@ -109,6 +213,7 @@ class TranslateApi:
         enable_api: bool = False,
         enable_gui: bool = False,
     ):
+        load_engines()
         # The database
         self.database_name = database_neme
         self.file_db = FileDatabase(database_neme)
@@ -116,6 +221,8 @@ class TranslateApi:
         self.temp_dir_name = Path(self.temp_dir.name)
 
         self.use_multi_thread = cfg["multi_thread"]["enable"]
+        # process running the layout / OCR of the jobs, started by the first one
+        self.pool = None
         
         self.pending_requests: list[TranslateRequest] = []
 
@@ -181,6 +288,7 @@ class TranslateApi:
         render_mode: str = Form(...),
         output_file_path: str = Form(None),
         add_blank_page: bool = Form(...),
+        layout_type: str = Form(None),
     ) -> FileResponse:
         """API endpoint for translating PDF files."""
         logger.info(
@@ -219,6 +327,7 @@ class TranslateApi:
             output_file_path=output_file_path,
             render_mode=render_mode,
             add_blank_page=add_blank_page,
+            layout_type=layout_type,
         )
         return JSONResponse(content={"message": response})
 
@@ -234,6 +343,7 @@ class TranslateApi:
         output_file_path: Optional[Path | str] = None,
         render_mode: Optional[str] = None,
         add_blank_page: bool = False,
+        layout_type: Optional[str] = None,
     ) -> None:
         """Submit a translation request."""
         req = TranslateRequest(
@@ -247,6 +357,7 @@ class TranslateApi:
             output_file_path=output_file_path,
             render_mode=render_mode,
             add_blank_page=add_blank_page,
+            layout_type=layout_type,
         )
         # self.req_db.add_request(req)
         # self.lock.acquire()
@@ -411,31 +522,64 @@ class TranslateApi:
         # 1. Getting layout and text
         if not self.use_multi_thread:
             # Use multi-processing to control the vram usage
-            # This will free the vram after each page is processed
+            # This will free the vram after each job is processed, unless the
+            # process is kept alive (CPU only by default, see keep_alive) so that
+            # the OCR sessions are reused by the next jobs
             # On 3090, the vram usage is around 5GB
             logger.info(f"\tUsing single-threading")
-            self.pool = Pool(1)
-            res = self.pool.apply_async(layout_and_ocr_process, args=(cfg, pdf_images))
-            self.pool.close()
-            self.pool.join()
-            results = res.get()
+            # Its worker is not daemonic, so it can start the OCR workers
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=1)
+            page_offset = 0 if translate_all else p_from
+            res = self.pool.submit(
+                layout_and_ocr_process, cfg, pdf_images, pdf_path, page_offset, self.DPI,
+                req.layout_type,
+            )
+            try:
+                results = res.result()
+            except BrokenProcessPool:
+                # the process died (out of memory...), the next job starts a new one
+                self.pool = None
+                raise
+            finally:
+                if self.pool is not None and not keep_alive(cfg):
+                    self.pool.shutdown()
+                    self.pool = None
         else:
             # Initialize the layout engine / OCR engine
-            layout_engine = load_layout_engine(cfg["layout"])
-            ocr_engine = load_ocr_engine(cfg["ocr"])
-
-            for i, image in enumerate(
-                zip(range(p_to - p_from), pdf_images), desc="Getting layout and texts"
-            ):
-                result: list[Layout] = layout_engine.get_single_layout(
-                    image
-                )  # Getting layout
-                result = ocr_engine.get_all_text(result)  # Getting text
+            page_offset = 0 if translate_all else p_from
+            layout_cfg = dict(cfg["layout"], DPI=self.DPI)
+            layout_cfg["type"] = select_layout_type(
+                layout_cfg, pdf_path, page_offset, page_offset + len(pdf_images), req.layout_type
+            )
+            layout_engine = load_layout_engine(layout_cfg)
+            layout_engine.set_document(pdf_path, page_offset)
+            layout_cache = load_layout_cache(layout_cfg)
+            ocr_engine = get_ocr_engine(cfg["ocr"])
+
+            for i, image in enumerate(tqdm(pdf_images, desc="Getting layout and texts")):
+                if layout_cache is None:
+                    result: list[Layout] = layout_engine.get_single_layout(
+                        image
+                    )  # Getting layout
+                else:
+                    result = layout_cache.get_layouts([image], layout_engine.get_layouts)[0]
+                # Getting text, from the text layer like layout_and_ocr_process and OCR for the rest
+                pending = fill_text_layer(
+                    cfg, layout_cfg["type"], [result], pdf_path, page_offset + i, self.DPI
+                )[0]
+                if pending:
+                    ocr_engine.get_all_text(pending, image)
                 results.append(result)
                 # translate the text in parallel
                 t = Thread(target=translate_one_page, args=(i, result))
                 threads.append(t)
                 t.start()
+            if layout_cache is not None:
+                layout_cache.log_stats()
+                layout_cache.close()
+            if not keep_alive(cfg):
+                close_ocr_engine()
 
         # 2. Translate the text
         logger.info(f"Translating pages")
@@ -444,12 +588,9 @@ class TranslateApi:
             for t in threads:
                 t.join()
         else:
-            # translate the text sequentially
-            for i, result in tqdm(
-                enumerate(results), leave=False, desc="Translating pages"
-            ):
-                result = translator.translate_all(result, from_lang, to_lang)
-                results[i] = result
+            # translate the whole document at once so that repeated
+            # segments (headers, footers...) are only translated once
+            results = translator.translate_document(results, from_lang, to_lang)
 
         # 3. Setting render font and render each page
         logger.info(f"Render the pages")
@@ -14,6 +14,7 @@ class TranslateRequest:
     output_file_path: Optional[Path | str] = None,
     render_mode: Optional[str] = None,
     add_blank_page: bool = False,
+    layout_type: Optional[str] = None
     def extract(self):
         if isinstance(self.pdf_path, str):
             self.pdf_path = Path(self.pdf_path)
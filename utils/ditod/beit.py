@@ -23,6 +23,7 @@ Hacked together by / Copyright 2020 Ross Wightman
 import warnings
 import math
 import torch
+from collections import OrderedDict
 from functools import partial
 import torch.nn as nn
 import torch.nn.functional as F
@@ -75,6 +76,127 @@ class Mlp(nn.Module):
         return x
 
 
+def get_relative_position_index(window_size):
+    """
+    Index in the bias table of each (query, key) token pair of a patch grid,
+    the cls token included.
+    """
+    num_relative_distance = (2 * window_size[0] - 1) * (2 * window_size[1] - 1) + 3
+    coords_h = torch.arange(window_size[0])
+    coords_w = torch.arange(window_size[1])
+    coords = torch.stack(torch.meshgrid([coords_h, coords_w]))  # 2, Wh, Ww
+    coords_flatten = torch.flatten(coords, 1)  # 2, Wh*Ww
+    relative_coords = coords_flatten[:, :, None] - coords_flatten[:, None, :]  # 2, Wh*Ww, Wh*Ww
+    relative_coords = relative_coords.permute(1, 2, 0).contiguous()  # Wh*Ww, Wh*Ww, 2
+    relative_coords[:, :, 0] += window_size[0] - 1  # shift to start from 0
+    relative_coords[:, :, 1] += window_size[1] - 1
+    relative_coords[:, :, 0] *= 2 * window_size[1] - 1
+    relative_position_index = \
+        torch.zeros(size=(window_size[0] * window_size[1] + 1,) * 2, dtype=relative_coords.dtype)
+    relative_position_index[1:, 1:] = relative_coords.sum(-1)  # Wh*Ww, Wh*Ww
+    relative_position_index[0, 0:] = num_relative_distance - 3
+    relative_position_index[0:, 0] = num_relative_distance - 2
+    relative_position_index[0, 0] = num_relative_distance - 1
+    return relative_position_index
+
+
+class RelativePositionBiasCache:
+    """
+    Relative position bias of the last `max_size` patch grids, within
+    `max_bytes`.
+
+    Pages of the same size give the same (Hp, Wp) grid, so the bicubic
+    interpolation of the bias table and its index are computed once per grid
+    and device instead of on every forward. The bias itself is only cached
+    when gradients are disabled, under a key holding the version of the
+    table so that loading new weights does not reuse stale values.
+
+    Each layer has its own cache and an entry holds (Hp * Wp + 1)^2 values
+    per head, about 0.5 GB for a 66 x 50 grid: the least recently used grids
+    are dropped beyond `max_bytes` and bigger entries are not cached. Only
+    used with `POS_TYPE: "shared_rel"` / `"rel"`, the shipped configs use
+    absolute position embeddings.
+    """
+
+    def __init__(self, max_size=1, max_bytes=256 * 2 ** 20):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self._index = OrderedDict()
+        self._bias = OrderedDict()
+
+    def nbytes(self):
+        return sum(
+            value.numel() * value.element_size()
+            for cache in (self._index, self._bias)
+            for value in cache.values()
+        )
+
+    def _lookup(self, cache, key):
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+        return None
+
+    def _store(self, cache, key, value):
+        if value.numel() * value.element_size() > self.max_bytes:
+            return
+        cache[key] = value
+        if len(cache) > self.max_size:
+            cache.popitem(last=False)
+        while self.nbytes() > self.max_bytes:
+            # the oldest entry of either cache, the new one fits alone
+            other = self._bias if cache is self._index else self._index
+            (other if other else cache).popitem(last=False)
+
+    def get_index(self, window_size, device):
+        key = (window_size, device)
+        index = self._lookup(self._index, key)
+        if index is None:
+            # a normal tensor, it is saved for backward when training
+            with torch.inference_mode(False):
+                index = get_relative_position_index(window_size).view(-1).to(device)
+            self._store(self._index, key, index)
+        return index
+
+    def __call__(self, table, window_size, num_heads, training_window_size):
+        window_size = tuple(int(s) for s in window_size)
+        if training_window_size is None:
+            training_window_size = window_size
+        elif isinstance(training_window_size, torch.Tensor):
+            training_window_size = tuple(training_window_size.tolist())
+        training_window_size = tuple(int(s) for s in training_window_size)
+
+        cacheable = not torch.is_grad_enabled()
+        key = (training_window_size, table.device, table.dtype, table._version)
+        if cacheable:
+            bias = self._lookup(self._bias, key)
+            if bias is not None:
+                return bias
+
+        if training_window_size == window_size:
+            new_relative_position_bias_table = table
+        else:
+            new_num_relative_distance = (2 * training_window_size[0] - 1) * (2 * training_window_size[1] - 1) + 3
+            # new_num_relative_dis 为 所有可能的相对位置选项，包含cls-cls，tok-cls，与cls-tok
+            new_relative_position_bias_table = F.interpolate(
+                table[:-3, :].permute(1, 0).view(1, num_heads, 2 * window_size[0] - 1, 2 * window_size[1] - 1),
+                size=(2 * training_window_size[0] - 1, 2 * training_window_size[1] - 1), mode='bicubic',
+                align_corners=False)
+            new_relative_position_bias_table = new_relative_position_bias_table.view(
+                num_heads, new_num_relative_distance - 3).permute(1, 0)
+            new_relative_position_bias_table = torch.cat(
+                [new_relative_position_bias_table, table[-3::]], dim=0)
+
+        num_tokens = training_window_size[0] * training_window_size[1] + 1
+        index = self.get_index(training_window_size, table.device)
+        relative_position_bias = new_relative_position_bias_table[index].view(
+            num_tokens, num_tokens, -1)  # Wh*Ww,Wh*Ww,nH
+        relative_position_bias = relative_position_bias.permute(2, 0, 1).contiguous()  # nH, Wh*Ww, Wh*Ww
+        if cacheable:
+            self._store(self._bias, key, relative_position_bias)
+        return relative_position_bias
+
+
 class Attention(nn.Module):
     def __init__(
             self, dim, num_heads=8, qkv_bias=False, qk_scale=None, attn_drop=0.,
@@ -103,24 +225,10 @@ class Attention(nn.Module):
                 torch.zeros(self.num_relative_distance, num_heads))  # 2*Wh-1 * 2*Ww-1, nH
             # cls to token & token 2 cls & cls to cls
 
-            # get pair-wise relative position index for each token inside the window
-            coords_h = torch.arange(window_size[0])
-            coords_w = torch.arange(window_size[1])
-            coords = torch.stack(torch.meshgrid([coords_h, coords_w]))  # 2, Wh, Ww
-            coords_flatten = torch.flatten(coords, 1)  # 2, Wh*Ww
-            relative_coords = coords_flatten[:, :, None] - coords_flatten[:, None, :]  # 2, Wh*Ww, Wh*Ww
-            relative_coords = relative_coords.permute(1, 2, 0).contiguous()  # Wh*Ww, Wh*Ww, 2
-            relative_coords[:, :, 0] += window_size[0] - 1  # shift to start from 0
-            relative_coords[:, :, 1] += window_size[1] - 1
-            relative_coords[:, :, 0] *= 2 * window_size[1] - 1
-            relative_position_index = \
-                torch.zeros(size=(window_size[0] * window_size[1] + 1,) * 2, dtype=relative_coords.dtype)
-            relative_position_index[1:, 1:] = relative_coords.sum(-1)  # Wh*Ww, Wh*Ww
-            relative_position_index[0, 0:] = self.num_relative_distance - 3
-            relative_position_index[0:, 0] = self.num_relative_distance - 2
-            relative_position_index[0, 0] = self.num_relative_distance - 1
+            relative_position_index = get_relative_position_index(window_size)
 
             self.register_buffer("relative_position_index", relative_position_index)
+            self.relative_position_bias_cache = RelativePositionBiasCache()
 
             # trunc_normal_(self.relative_position_bias_table, std=.0)
         else:
@@ -146,53 +254,9 @@ class Attention(nn.Module):
         attn = (q @ k.transpose(-2, -1))
 
         if self.relative_position_bias_table is not None:
-            if training_window_size == self.window_size:
-                relative_position_bias = \
-                    self.relative_position_bias_table[self.relative_position_index.view(-1)].view(
-                        self.window_size[0] * self.window_size[1] + 1,
-                        self.window_size[0] * self.window_size[1] + 1, -1)  # Wh*Ww,Wh*Ww,nH
-                relative_position_bias = relative_position_bias.permute(2, 0, 1).contiguous()  # nH, Wh*Ww, Wh*Ww
-                attn = attn + relative_position_bias.unsqueeze(0)
-            else:
-                training_window_size = tuple(training_window_size.tolist())
-                new_num_relative_distance = (2 * training_window_size[0] - 1) * (2 * training_window_size[1] - 1) + 3
-                # new_num_relative_dis 为 所有可能的相对位置选项，包含cls-cls，tok-cls，与cls-tok
-                new_relative_position_bias_table = F.interpolate(
-                    self.relative_position_bias_table[:-3, :].permute(1, 0).view(1, self.num_heads,
-                                                                                 2 * self.window_size[0] - 1,
-                                                                                 2 * self.window_size[1] - 1),
-                    size=(2 * training_window_size[0] - 1, 2 * training_window_size[1] - 1), mode='bicubic',
-                    align_corners=False)
-                new_relative_position_bias_table = new_relative_position_bias_table.view(self.num_heads,
-                                                                                         new_num_relative_distance - 3).permute(
-                    1, 0)
-                new_relative_position_bias_table = torch.cat(
-                    [new_relative_position_bias_table, self.relative_position_bias_table[-3::]], dim=0)
-
-                # get pair-wise relative position index for each token inside the window
-                coords_h = torch.arange(training_window_size[0])
-                coords_w = torch.arange(training_window_size[1])
-                coords = torch.stack(torch.meshgrid([coords_h, coords_w]))  # 2, Wh, Ww
-                coords_flatten = torch.flatten(coords, 1)  # 2, Wh*Ww
-                relative_coords = coords_flatten[:, :, None] - coords_flatten[:, None, :]  # 2, Wh*Ww, Wh*Ww
-                relative_coords = relative_coords.permute(1, 2, 0).contiguous()  # Wh*Ww, Wh*Ww, 2
-                relative_coords[:, :, 0] += training_window_size[0] - 1  # shift to start from 0
-                relative_coords[:, :, 1] += training_window_size[1] - 1
-                relative_coords[:, :, 0] *= 2 * training_window_size[1] - 1
-                relative_position_index = \
-                    torch.zeros(size=(training_window_size[0] * training_window_size[1] + 1,) * 2,
-                                dtype=relative_coords.dtype)
-                relative_position_index[1:, 1:] = relative_coords.sum(-1)  # Wh*Ww, Wh*Ww
-                relative_position_index[0, 0:] = new_num_relative_distance - 3
-                relative_position_index[0:, 0] = new_num_relative_distance - 2
-                relative_position_index[0, 0] = new_num_relative_distance - 1
-
-                relative_position_bias = \
-                    new_relative_position_bias_table[relative_position_index.view(-1)].view(
-                        training_window_size[0] * training_window_size[1] + 1,
-                        training_window_size[0] * training_window_size[1] + 1, -1)  # Wh*Ww,Wh*Ww,nH
-                relative_position_bias = relative_position_bias.permute(2, 0, 1).contiguous()  # nH, Wh*Ww, Wh*Ww
-                attn = attn + relative_position_bias.unsqueeze(0)
+            relative_position_bias = self.relative_position_bias_cache(
+                self.relative_position_bias_table, self.window_size, self.num_heads, training_window_size)
+            attn = attn + relative_position_bias.unsqueeze(0)
 
         if rel_pos_bias is not None:
             attn = attn + rel_pos_bias
@@ -324,75 +388,16 @@ class RelativePositionBias(nn.Module):
             torch.zeros(self.num_relative_distance, num_heads))  # 2*Wh-1 * 2*Ww-1, nH
         # cls to token & token 2 cls & cls to cls
 
-        # get pair-wise relative position index for each token inside the window
-        coords_h = torch.arange(window_size[0])
-        coords_w = torch.arange(window_size[1])
-        coords = torch.stack(torch.meshgrid([coords_h, coords_w]))  # 2, Wh, Ww
-        coords_flatten = torch.flatten(coords, 1)  # 2, Wh*Ww
-        relative_coords = coords_flatten[:, :, None] - coords_flatten[:, None, :]  # 2, Wh*Ww, Wh*Ww
-        relative_coords = relative_coords.permute(1, 2, 0).contiguous()  # Wh*Ww, Wh*Ww, 2
-        relative_coords[:, :, 0] += window_size[0] - 1  # shift to start from 0
-        relative_coords[:, :, 1] += window_size[1] - 1
-        relative_coords[:, :, 0] *= 2 * window_size[1] - 1
-        relative_position_index = \
-            torch.zeros(size=(window_size[0] * window_size[1] + 1,) * 2, dtype=relative_coords.dtype)
-        relative_position_index[1:, 1:] = relative_coords.sum(-1)  # Wh*Ww, Wh*Ww
-        relative_position_index[0, 0:] = self.num_relative_distance - 3
-        relative_position_index[0:, 0] = self.num_relative_distance - 2
-        relative_position_index[0, 0] = self.num_relative_distance - 1
+        relative_position_index = get_relative_position_index(window_size)
 
         self.register_buffer("relative_position_index", relative_position_index)
+        self.relative_position_bias_cache = RelativePositionBiasCache()
 
         # trunc_normal_(self.relative_position_bias_table, std=.02)
 
     def forward(self, training_window_size):
-        if training_window_size == self.window_size:
-            relative_position_bias = \
-                self.relative_position_bias_table[self.relative_position_index.view(-1)].view(
-                    self.window_size[0] * self.window_size[1] + 1,
-                    self.window_size[0] * self.window_size[1] + 1, -1)  # Wh*Ww,Wh*Ww,nH
-            relative_position_bias = relative_position_bias.permute(2, 0, 1).contiguous()  # nH, Wh*Ww, Wh*Ww
-        else:
-            training_window_size = tuple(training_window_size.tolist())
-            new_num_relative_distance = (2 * training_window_size[0] - 1) * (2 * training_window_size[1] - 1) + 3
-            # new_num_relative_dis 为 所有可能的相对位置选项，包含cls-cls，tok-cls，与cls-tok
-            new_relative_position_bias_table = F.interpolate(
-                self.relative_position_bias_table[:-3, :].permute(1, 0).view(1, self.num_heads,
-                                                                             2 * self.window_size[0] - 1,
-                                                                             2 * self.window_size[1] - 1),
-                size=(2 * training_window_size[0] - 1, 2 * training_window_size[1] - 1), mode='bicubic',
-                align_corners=False)
-            new_relative_position_bias_table = new_relative_position_bias_table.view(self.num_heads,
-                                                                                     new_num_relative_distance - 3).permute(
-                1, 0)
-            new_relative_position_bias_table = torch.cat(
-                [new_relative_position_bias_table, self.relative_position_bias_table[-3::]], dim=0)
-
-            # get pair-wise relative position index for each token inside the window
-            coords_h = torch.arange(training_window_size[0])
-            coords_w = torch.arange(training_window_size[1])
-            coords = torch.stack(torch.meshgrid([coords_h, coords_w]))  # 2, Wh, Ww
-            coords_flatten = torch.flatten(coords, 1)  # 2, Wh*Ww
-            relative_coords = coords_flatten[:, :, None] - coords_flatten[:, None, :]  # 2, Wh*Ww, Wh*Ww
-            relative_coords = relative_coords.permute(1, 2, 0).contiguous()  # Wh*Ww, Wh*Ww, 2
-            relative_coords[:, :, 0] += training_window_size[0] - 1  # shift to start from 0
-            relative_coords[:, :, 1] += training_window_size[1] - 1
-            relative_coords[:, :, 0] *= 2 * training_window_size[1] - 1
-            relative_position_index = \
-                torch.zeros(size=(training_window_size[0] * training_window_size[1] + 1,) * 2,
-                            dtype=relative_coords.dtype)
-            relative_position_index[1:, 1:] = relative_coords.sum(-1)  # Wh*Ww, Wh*Ww
-            relative_position_index[0, 0:] = new_num_relative_distance - 3
-            relative_position_index[0:, 0] = new_num_relative_distance - 2
-            relative_position_index[0, 0] = new_num_relative_distance - 1
-
-            relative_position_bias = \
-                new_relative_position_bias_table[relative_position_index.view(-1)].view(
-                    training_window_size[0] * training_window_size[1] + 1,
-                    training_window_size[0] * training_window_size[1] + 1, -1)  # Wh*Ww,Wh*Ww,nH
-            relative_position_bias = relative_position_bias.permute(2, 0, 1).contiguous()  # nH, Wh*Ww, Wh*Ww
-
-        return relative_position_bias
+        return self.relative_position_bias_cache(
+            self.relative_position_bias_table, self.window_size, self.num_heads, training_window_size)
 
 
 class BEiT(nn.Module):
@@ -0,0 +1,147 @@
+"""
+Compare the speed and accuracy of the low precision layout models to FP32.
+
+The FP32 layouts are the reference: the mAP of each precision is computed
+against them (COCO style, IoU 0.5:0.95) on a fixed sample of pages, so the
+drift is 1 - mAP.
+
+Usage:
+    python -m utils.layout_benchmark --pages pages/ --device cpu
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+from .layout_model import Layout, LayoutAnalyzer
+from .ocr_model.quantize import load_images
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+CLASSES = ["text", "title", "list", "table", "figure"]
+
+
+def box_iou(boxes1: np.ndarray, boxes2: np.ndarray) -> np.ndarray:
+    """(N, M) IoU of two sets of (x1, y1, x2, y2) boxes."""
+    boxes1 = boxes1.reshape(-1, 4).astype(np.float64)
+    boxes2 = boxes2.reshape(-1, 4).astype(np.float64)
+    iw = np.minimum(boxes1[:, None, 2], boxes2[None, :, 2]) - np.maximum(
+        boxes1[:, None, 0], boxes2[None, :, 0]
+    )
+    ih = np.minimum(boxes1[:, None, 3], boxes2[None, :, 3]) - np.maximum(
+        boxes1[:, None, 1], boxes2[None, :, 1]
+    )
+    inter = np.clip(iw, 0, None) * np.clip(ih, 0, None)
+    area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+    union = area1[:, None] + area2[None, :] - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+def average_precision(
+    predictions: list[list[Layout]], references: list[list[Layout]], cls: str, iou: float
+) -> float | None:
+    """
+    101 point interpolated AP of one class at one IoU threshold, None if the
+    class is absent from the references.
+    """
+    scores, matched = [], []
+    n_refs = 0
+    for preds, refs in zip(predictions, references):
+        preds = sorted((p for p in preds if p.type == cls), key=lambda p: -p.score)
+        ref_boxes = np.array([r.bbox for r in refs if r.type == cls])
+        n_refs += len(ref_boxes)
+        taken = np.zeros(len(ref_boxes), dtype=bool)
+        ious = box_iou(np.array([p.bbox for p in preds]), ref_boxes)
+        for i, pred in enumerate(preds):
+            scores.append(pred.score)
+            candidates = np.where(taken, -1, ious[i]) if len(ref_boxes) else np.array([])
+            best = int(np.argmax(candidates)) if len(candidates) else -1
+            hit = best >= 0 and candidates[best] >= iou
+            if hit:
+                taken[best] = True
+            matched.append(hit)
+    if n_refs == 0:
+        return None
+    order = np.argsort(-np.array(scores), kind="stable")
+    tp = np.cumsum(np.array(matched, dtype=bool)[order])
+    recall = tp / n_refs
+    precision = tp / np.arange(1, len(tp) + 1)
+    # precision envelope
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    points = np.linspace(0, 1, 101)
+    idx = np.searchsorted(recall, points, side="left")
+    return float(np.mean([precision[i] if i < len(precision) else 0.0 for i in idx]))
+
+
+def mean_average_precision(predictions, references) -> float:
+    aps = [
+        average_precision(predictions, references, cls, iou)
+        for cls in CLASSES
+        for iou in IOU_THRESHOLDS
+    ]
+    aps = [ap for ap in aps if ap is not None]
+    return float(np.mean(aps)) if aps else 1.0
+
+
+def run(analyzer: LayoutAnalyzer, images: list, repeat: int = 1) -> tuple[list, float]:
+    """
+    Analyze the pages.
+
+    Returns
+    -------
+    tuple[list, float]
+        The layouts of each page and the mean time to analyze all the pages.
+    """
+    # the first run pays for the allocator / kernel selection warm up
+    analyzer.batch(images[:1])
+    layouts, elapsed = [], 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        layouts = analyzer.batch(images)
+        elapsed += time.perf_counter() - start
+    return layouts, elapsed / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the layout model precisions against FP32")
+    parser.add_argument("--pages", type=Path, required=True, help="Directory of page images")
+    parser.add_argument("--model_root_dir", type=Path, default=Path("models/unilm"))
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--precisions", nargs="+", default=["bf16", "int8"])
+    parser.add_argument("--num_pages", type=int, default=20, help="Size of the page sample")
+    parser.add_argument("--batch_size", type=int, default=1)
+    parser.add_argument("--num_threads", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # sorted by file name, so the sample is the same on every run
+    images = load_images(args.pages)[: args.num_pages]
+    if not images:
+        parser.error(f"No images found in {args.pages}")
+
+    results = {}
+    for precision in ["fp32"] + [p for p in args.precisions if p != "fp32"]:
+        analyzer = LayoutAnalyzer(
+            args.model_root_dir,
+            args.device,
+            batch_size=args.batch_size,
+            precision=precision,
+            num_threads=args.num_threads,
+        )
+        results[precision] = run(analyzer, images, args.repeat)
+        del analyzer
+
+    ref_layouts, ref_elapsed = results["fp32"]
+    print(f"{len(images)} pages, {sum(map(len, ref_layouts))} reference boxes")
+    print(f"{'precision':<10}{'pages/s':>10}{'speedup':>10}{'mAP':>10}{'drift':>10}")
+    for precision, (layouts, elapsed) in results.items():
+        mAP = mean_average_precision(layouts, ref_layouts)
+        print(
+            f"{precision:<10}{len(images) / elapsed:>10.2f}{ref_elapsed / elapsed:>9.2f}x"
+            f"{mAP:>10.3f}{1 - mAP:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
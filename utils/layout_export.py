@@ -0,0 +1,145 @@
+"""
+Export the DiT cascade layout model to ONNX and check it against PyTorch.
+
+The graph is traced for one input size: the largest resized page of
+`--pages` rounded up to the padding of the model, other pages are shrunk
+to fit in it. The mask head is not used by the layouts and is left out.
+The settings of the preprocessing are saved next to the model, which is
+then used with `type: dit_onnx` in the layout section of config.yaml.
+
+The check runs both models on the pages and reports their mAP against the
+PyTorch layouts, their load time and their speed.
+
+Usage:
+    python -m utils.layout_export --pages pages/
+    python -m utils.layout_export --pages pages/ --check
+"""
+import argparse
+import json
+import math
+import time
+from pathlib import Path
+
+import numpy as np
+
+from .layout_benchmark import mean_average_precision, run
+from .layout_model import LayoutAnalyzer
+from .layout_onnx import ONNXLayoutAnalyzer, metadata_path, preprocess, resize_shortest_edge
+from .ocr_model.quantize import load_images
+
+ONNX_OPSET = 16
+
+
+def export(analyzer: LayoutAnalyzer, images: list[np.ndarray], output_path: Path) -> Path:
+    """
+    Export the model of a LayoutAnalyzer to ONNX.
+
+    Parameters
+    ----------
+    analyzer : LayoutAnalyzer
+        FP32 analyzer on CPU.
+    images : list[np.ndarray]
+        Sample pages, they give the input size of the graph.
+    output_path : Path
+        Path of the ONNX model.
+
+    Returns
+    -------
+    Path
+        Path of the ONNX model.
+    """
+    import torch
+    from detectron2.export import TracingAdapter
+
+    cfg = analyzer.predictor.cfg
+    model = analyzer.predictor.model
+    model.roi_heads.mask_on = False
+    divisibility = model.backbone.size_divisibility
+    sizes = [
+        resize_shortest_edge(*image.shape[:2], cfg.INPUT.MIN_SIZE_TEST, cfg.INPUT.MAX_SIZE_TEST)
+        for image in images
+    ]
+    height, width = (
+        math.ceil(max(size[i] for size in sizes) / divisibility) * divisibility for i in range(2)
+    )
+    metadata = {
+        "input_format": cfg.INPUT.FORMAT,
+        "min_size": cfg.INPUT.MIN_SIZE_TEST,
+        "max_size": cfg.INPUT.MAX_SIZE_TEST,
+        "pixel_mean": list(cfg.MODEL.PIXEL_MEAN),
+        "input_size": [height, width],
+    }
+    metadata_path(output_path).write_text(json.dumps(metadata, indent=2))
+
+    # trace with the preprocessing of the ONNX analyzer, on the first page
+    sample, _ = preprocess(images[0], **metadata)
+    inputs = [{"image": torch.as_tensor(sample)}]
+
+    def inference(model, inputs):
+        # boxes in the coordinates of the input, mapped to the page by the analyzer
+        instances = model.inference(inputs, do_postprocess=False)[0]
+        return [{"instances": instances}]
+
+    adapter = TracingAdapter(model, inputs, inference)
+    with torch.no_grad():
+        torch.onnx.export(
+            adapter,
+            adapter.flattened_inputs,
+            str(output_path),
+            opset_version=ONNX_OPSET,
+            input_names=["image"],
+            output_names=["boxes", "classes", "scores", "image_size"],
+            dynamo=False,
+        )
+    return output_path
+
+
+def check(model_root_dir: Path, model_path: Path, images: list[np.ndarray], num_threads=None):
+    """
+    Compare the ONNX model to the PyTorch one on the pages.
+    """
+    results, load_times = {}, {}
+    for name in ["pytorch", "onnx"]:
+        start = time.perf_counter()
+        if name == "pytorch":
+            analyzer = LayoutAnalyzer(model_root_dir, "cpu", num_threads=num_threads)
+        else:
+            analyzer = ONNXLayoutAnalyzer(model_path, num_threads=num_threads)
+        load_times[name] = time.perf_counter() - start
+        results[name] = run(analyzer, images)
+        del analyzer
+
+    ref_layouts, ref_elapsed = results["pytorch"]
+    print(f"{len(images)} pages, {sum(map(len, ref_layouts))} reference boxes")
+    print(f"{'model':<10}{'load s':>10}{'pages/s':>10}{'speedup':>10}{'mAP':>10}")
+    for name, (layouts, elapsed) in results.items():
+        mAP = mean_average_precision(layouts, ref_layouts)
+        print(
+            f"{name:<10}{load_times[name]:>10.2f}{len(images) / elapsed:>10.2f}"
+            f"{ref_elapsed / elapsed:>9.2f}x{mAP:>10.3f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the DiT layout model to ONNX")
+    parser.add_argument("--pages", type=Path, required=True, help="Directory of sample page images")
+    parser.add_argument("--model_root_dir", type=Path, default=Path("models/unilm"))
+    parser.add_argument(
+        "--output", type=Path, default=Path("models/unilm/publaynet_dit-b_cascade.onnx")
+    )
+    parser.add_argument("--check", action="store_true", help="Only compare the exported model to PyTorch")
+    parser.add_argument("--num_threads", type=int, default=None)
+    args = parser.parse_args()
+
+    images = load_images(args.pages)
+    if not images:
+        parser.error(f"No images found in {args.pages}")
+    if args.check:
+        check(args.model_root_dir, args.output, images, args.num_threads)
+        return
+    analyzer = LayoutAnalyzer(args.model_root_dir, "cpu")
+    print(f"Saved {export(analyzer, images, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,73 @@
+import contextlib
 import sys
 from pathlib import Path
 import cv2
 import numpy as np
 from typing import Literal, Optional
 from dataclasses import asdict, dataclass, field
+from loguru import logger
 
-from detectron2.config import get_cfg
-from detectron2.engine import DefaultPredictor
-from detectron2.config import CfgNode as CN
-from utils.ditod.config import add_vit_config
 
 #from ditod import add_vit_config
 #from ditod.VGTTrainer import DefaultPredictor
 
+# boxes of the same group are duplicates when they overlap: text, title and
+# list boxes all go to OCR, so a text box inside a list box is read twice
+SUPPRESSION_GROUPS = {"text": 0, "title": 0, "list": 0, "table": 1, "figure": 2}
+
+
+def suppress_overlaps(
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    groups: np.ndarray,
+    iou_threshold: Optional[float] = 0.5,
+    containment_threshold: Optional[float] = 0.9,
+) -> np.ndarray:
+    """
+    Group-aware NMS and containment suppression.
+
+    A box lying inside a bigger box of its group by at least
+    `containment_threshold` of its area is dropped, then the remaining boxes
+    overlapping a higher scored box of their group by more than
+    `iou_threshold` IoU are. A threshold of None disables its rule.
+
+    Returns
+    -------
+    np.ndarray
+        Boolean mask of the kept boxes.
+    """
+    n = len(boxes)
+    keep = np.ones(n, dtype=bool)
+    if n < 2:
+        return keep
+    boxes = boxes.reshape(-1, 4).astype(np.float64)
+    iw = np.minimum(boxes[:, None, 2], boxes[None, :, 2]) - np.maximum(boxes[:, None, 0], boxes[None, :, 0])
+    ih = np.minimum(boxes[:, None, 3], boxes[None, :, 3]) - np.maximum(boxes[:, None, 1], boxes[None, :, 1])
+    inter = np.clip(iw, 0, None) * np.clip(ih, 0, None)
+    area = np.maximum((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]), 1e-9)
+    same = groups[:, None] == groups[None, :]
+    np.fill_diagonal(same, False)
+    order = np.argsort(-scores, kind="stable")
+    rank = np.empty(n, dtype=int)
+    rank[order] = np.arange(n)
+
+    if containment_threshold is not None:
+        # i inside j, the smaller box goes (the lower scored one if same size)
+        smaller = (area[:, None] < area[None, :]) | (
+            (area[:, None] == area[None, :]) & (rank[:, None] > rank[None, :])
+        )
+        contained = same & smaller & (inter / area[:, None] >= containment_threshold)
+        keep &= ~contained.any(axis=1)
+
+    if iou_threshold is not None:
+        iou = inter / (area[:, None] + area[None, :] - inter)
+        overlapping = same & (iou > iou_threshold) & (rank[None, :] > rank[:, None])
+        for i in order:
+            if keep[i]:
+                keep[overlapping[i]] = False
+    return keep
+
+
 @dataclass
 class Layout:
     type: Literal["text", "title", "list", "table", "figure", "processed_text"]
@@ -37,56 +92,192 @@ class Layout:
 
 
 class LayoutAnalyzer:
-    def __init__(self, model_root_dir: Path, device: str = "cuda") -> None:
+    # the pages are downscaled by raster_scale and to at most raster_max_side
+    # pixels before the model, see set_raster
+    raster_scale = 1.0
+    raster_max_side = None
+    # duplicate boxes are dropped with these thresholds, see set_suppression
+    iou_threshold = 0.5
+    containment_threshold = 0.9
+
+    def __init__(
+        self,
+        model_root_dir: Path,
+        device: str = "cuda",
+        batch_size: int = 1,
+        precision: str = "fp32",
+        num_threads: Optional[int] = None,
+        channels_last: bool = False,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        model_root_dir : Path
+            Path to the DiT model root directory.
+        device : str, optional
+            Device to use, by default "cuda"
+        batch_size : int, optional
+            Pages per forward pass of `batch`, by default 1
+        precision : str, optional
+            "fp32", "bf16" (autocast, on CPUs / GPUs supporting it) or "int8"
+            (dynamic quantization of the backbone linears, CPU only), by
+            default "fp32"
+        num_threads : int, optional
+            Number of torch CPU threads, by default torch's
+        channels_last : bool, optional
+            Use the channels last memory format for the convolutions of the
+            FPN and heads, by default False
+        """
+        # torch and detectron2 are imported when the model is used, so that
+        # Layout and the ONNX analyzer do not depend on them
+        import torch
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.device = device
+        self.precision = precision
         self.predictor = self._load_model(model_root_dir, device=device)
+        self._set_precision(precision, channels_last)
+        self.batch_size = batch_size
 
     def __call__(self, image: np.ndarray) -> list[Layout]:
         #grid_path = args.grid_root + args.image_name + ".pdf.pkl"
-        output = self.predictor(image)["instances"].to("cpu")
-
-        layouts = []
-        for class_id, box, score in zip(
-            output.pred_classes.numpy(),
-            output.pred_boxes.tensor.numpy().astype(int),
-            output.scores.numpy(),
-        ):
-            if score > 0.8:
-                layouts.append(
-                    Layout(
-                        type=self._id_to_class_names[class_id], bbox=box, score=score
-                    )
-                )
+        return self.batch([image], batch_size=1)[0]
 
-        #layouts = self._remove_overlapping_layouts(layouts)
+    def set_raster(self, scale: float = 1.0, max_side: Optional[int] = None):
+        """
+        Run the model on a downscaled copy of the pages.
 
-        for layout in layouts:
-            layout.image = self._get_image(image, layout.bbox)
+        The model resizes its input to about 800 x 1333 pixels anyway, so the
+        full OCR raster is not needed: the pages are shrunk by `scale` and to
+        at most `max_side` pixels, the boxes are mapped back to the page and
+        the layout images are still cropped from the full page.
+        """
+        self.raster_scale = scale
+        self.raster_max_side = max_side
 
-        return layouts
+    def set_suppression(
+        self, iou_threshold: Optional[float] = 0.5, containment_threshold: Optional[float] = 0.9
+    ):
+        """
+        Thresholds of the suppression of the duplicate boxes, see
+        `suppress_overlaps`. None disables a rule.
+        """
+        self.iou_threshold = iou_threshold
+        self.containment_threshold = containment_threshold
+
+    def _layout_raster(self, image: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """The page given to the model and its (x, y, x, y) scale factors."""
+        height, width = image.shape[:2]
+        factor = min(1.0, self.raster_scale)
+        if self.raster_max_side:
+            factor = min(factor, self.raster_max_side / max(height, width))
+        if factor >= 1.0:
+            return image, np.ones(4, dtype=np.float32)
+        size = (max(1, round(width * factor)), max(1, round(height * factor)))
+        small = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        fx, fy = size[0] / width, size[1] / height
+        return small, np.array([fx, fy, fx, fy], dtype=np.float32)
 
-    def _remove_overlapping_layouts(self, layouts: list[Layout]) -> list[Layout]:
-        if not layouts:
-            return []
+    def _set_precision(self, precision: str, channels_last: bool):
+        import torch
 
-        # Sort layouts by confidence score (high to low)
-        layouts.sort(key=lambda x: x.score, reverse=True)
+        model = self.predictor.model
+        device_type = torch.device(self.device).type
+        if precision == "int8":
+            if device_type != "cpu":
+                raise ValueError("int8 layout inference is only supported on CPU")
+            # the transformer blocks are almost all Linear layers
+            model.backbone = torch.ao.quantization.quantize_dynamic(
+                model.backbone, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        elif precision == "bf16":
+            supported = (
+                torch.ops.mkldnn._is_mkldnn_bf16_supported()
+                if device_type == "cpu"
+                else torch.cuda.is_bf16_supported()
+            )
+            if not supported:
+                logger.warning(f"bf16 is not supported on {self.device}, using fp32")
+                self.precision = "fp32"
+        elif precision != "fp32":
+            raise ValueError(f"Unsupported layout precision: {precision}")
+        if channels_last:
+            model.to(memory_format=torch.channels_last)
 
-        non_overlapping_layouts = []
-        while layouts:
-            # Take the layout with the highest score
-            current_layout = layouts.pop(0)
-            non_overlapping = True
+    def _inference_context(self) -> contextlib.ExitStack:
+        import torch
 
-            for other_layout in non_overlapping_layouts:
-                # If IoU is above a threshold (e.g., 0.5), consider it as overlapping
-                if self._calculate_iou(current_layout.bbox, other_layout.bbox) > 0.5:
-                    non_overlapping = False
-                    break
+        stack = contextlib.ExitStack()
+        stack.enter_context(torch.inference_mode())
+        if self.precision == "bf16":
+            stack.enter_context(
+                torch.autocast(device_type=torch.device(self.device).type, dtype=torch.bfloat16)
+            )
+        return stack
 
-            if non_overlapping:
-                non_overlapping_layouts.append(current_layout)
+    def batch(self, images: list[np.ndarray], batch_size: Optional[int] = None) -> list[list[Layout]]:
+        """
+        Analyze the layout of several pages, `batch_size` pages per forward pass.
 
-        return non_overlapping_layouts
+        The pages are resized like DefaultPredictor does, the model pads them
+        to the size of the largest page of the batch and its outputs are
+        given in the coordinates of each page.
+        """
+        import torch
+
+        batch_size = batch_size or self.batch_size
+        predictor = self.predictor
+        results = []
+        for beg in range(0, len(images), batch_size):
+            chunk = images[beg : beg + batch_size]
+            rasters = [self._layout_raster(image) for image in chunk]
+            inputs = []
+            for original_image, _ in rasters:
+                if predictor.input_format == "RGB":
+                    original_image = original_image[:, :, ::-1]
+                height, width = original_image.shape[:2]
+                resized = predictor.aug.get_transform(original_image).apply_image(original_image)
+                tensor = torch.as_tensor(resized.astype("float32").transpose(2, 0, 1))
+                inputs.append({"image": tensor, "height": height, "width": width})
+            with self._inference_context():
+                outputs = predictor.model(inputs)
+            for image, (_, factors), output in zip(chunk, rasters, outputs):
+                output = output["instances"].to("cpu")
+                results.append(
+                    self._to_layouts(
+                        image,
+                        output.pred_classes.numpy(),
+                        output.pred_boxes.tensor.float().numpy() / factors,
+                        output.scores.float().numpy(),
+                    )
+                )
+        return results
+
+    def _to_layouts(
+        self, image: np.ndarray, classes: np.ndarray, boxes: np.ndarray, scores: np.ndarray
+    ) -> list[Layout]:
+        """Layouts of the detected boxes, in the coordinates of `image`."""
+        confident = scores > 0.8
+        classes, boxes, scores = classes[confident], boxes[confident], scores[confident]
+        names = [self._id_to_class_names[int(class_id)] for class_id in classes]
+        keep = suppress_overlaps(
+            boxes,
+            scores,
+            np.array([SUPPRESSION_GROUPS[name] for name in names], dtype=int),
+            self.iou_threshold,
+            self.containment_threshold,
+        )
+        layouts = [
+            Layout(type=name, bbox=box, score=score)
+            for name, box, score, kept in zip(names, boxes.astype(int), scores, keep)
+            if kept
+        ]
+
+        for layout in layouts:
+            layout.image = self._get_image(image, layout.bbox)
+
+        return layouts
 
     def _get_image(self, image: np.ndarray, bbox: tuple[float, ...]) -> np.ndarray:
         x1, y1, x2, y2 = bbox
@@ -104,7 +295,12 @@ class LayoutAnalyzer:
 
     def _load_model(
         self, model_root_dir: Path, device: str = "cuda"
-    ) -> DefaultPredictor:
+    ) -> "DefaultPredictor":
+        # detectron2 is only needed to run the PyTorch model
+        from detectron2.config import get_cfg
+        from detectron2.engine import DefaultPredictor
+        from utils.ditod.config import add_vit_config
+
         cfg = get_cfg()
         add_vit_config(cfg)
         cfg.merge_from_file(str(model_root_dir / "config/cascade_dit_base.yml"))
@@ -112,27 +308,6 @@ class LayoutAnalyzer:
         cfg.MODEL.DEVICE = device
         return DefaultPredictor(cfg)
 
-    def _calculate_iou(self, box1: tuple[float, ...], box2: tuple[float, ...]) -> float:
-        x1, y1, x2, y2 = box1
-        x1_, y1_, x2_, y2_ = box2
-
-        # calculate the intersection coordinates
-        xi1 = max(x1, x1_)
-        yi1 = max(y1, y1_)
-        xi2 = min(x2, x2_)
-        yi2 = min(y2, y2_)
-        inter_area = max(xi2 - xi1, 0) * max(yi2 - yi1, 0)
-
-        # calculate each box area
-        box1_area = (x2 - x1) * (y2 - y1)
-        box2_area = (x2_ - x1_) * (y2_ - y1_)
-
-        # calculate union area
-        union_area = box1_area + box2_area - inter_area
-
-        # compute the IoU
-        return inter_area / union_area if union_area != 0 else 0
-
 
 if __name__ == "__main__":
     layout_analyzer = LayoutAnalyzer(Path("models/"))
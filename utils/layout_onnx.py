@@ -0,0 +1,126 @@
+"""
+Run the DiT layout model exported by `python -m utils.layout_export` with
+onnxruntime, without PyTorch or detectron2.
+
+The exported graph holds the backbone and the cascade heads for a fixed
+input size. The resizing / padding detectron2 does before the model and the
+mapping of the boxes back to the page after it are done here with NumPy.
+"""
+import json
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import onnxruntime as ort
+from PIL import Image
+
+from .layout_model import Layout, LayoutAnalyzer
+
+
+def metadata_path(model_path: Path) -> Path:
+    """
+    Path of the preprocessing settings saved next to an exported model.
+    """
+    return model_path.with_suffix(".json")
+
+
+def resize_shortest_edge(height: int, width: int, size: int, max_size: int) -> tuple[int, int]:
+    """
+    Output (height, width) of detectron2's ResizeShortestEdge at test time.
+    """
+    scale = size * 1.0 / min(height, width)
+    if height < width:
+        newh, neww = size, scale * width
+    else:
+        newh, neww = scale * height, size
+    if max(newh, neww) > max_size:
+        scale = max_size * 1.0 / max(newh, neww)
+        newh = newh * scale
+        neww = neww * scale
+    return int(newh + 0.5), int(neww + 0.5)
+
+
+def preprocess(
+    image: np.ndarray,
+    input_format: str,
+    min_size: int,
+    max_size: int,
+    input_size: tuple[int, int],
+    pixel_mean: list[float],
+) -> tuple[np.ndarray, tuple[int, int]]:
+    """
+    Resize the page like DefaultPredictor and pad it to the input size of
+    the exported model.
+
+    Returns
+    -------
+    tuple[np.ndarray, tuple[int, int]]
+        The (3, H, W) float32 input and the size of the resized page in it.
+    """
+    height, width = input_size
+    if input_format == "RGB":
+        image = image[:, :, ::-1]
+    newh, neww = resize_shortest_edge(*image.shape[:2], min_size, max_size)
+    # pages of another format than the export sample are shrunk to fit
+    fit = min(1.0, height / newh, width / neww)
+    if fit < 1.0:
+        newh, neww = int(newh * fit), int(neww * fit)
+    resized = Image.fromarray(np.ascontiguousarray(image)).resize((neww, newh), Image.BILINEAR)
+    # the mean pixel is 0 once normalized, like detectron2's padding
+    inputs = np.empty((3, height, width), dtype=np.float32)
+    inputs[:] = np.asarray(pixel_mean, dtype=np.float32)[:, None, None]
+    inputs[:, :newh, :neww] = np.asarray(resized).transpose(2, 0, 1)
+    return inputs, (newh, neww)
+
+
+class ONNXLayoutAnalyzer(LayoutAnalyzer):
+    def __init__(self, model_path: Path, num_threads: Optional[int] = None) -> None:
+        """
+        Parameters
+        ----------
+        model_path : Path
+            Path to the exported ONNX model, its settings are read from the
+            JSON file of the same name.
+        num_threads : int, optional
+            Number of onnxruntime intra-op threads, by default onnxruntime's
+
+        Raises
+        ------
+        FileNotFoundError
+            If the model has not been exported.
+        """
+        model_path = Path(model_path)
+        if not model_path.exists():
+            raise FileNotFoundError(
+                f"{model_path} not found, export it with `python -m utils.layout_export`"
+            )
+        self.metadata = json.loads(metadata_path(model_path).read_text())
+        # one page per run, the graph is traced for a single image
+        self.batch_size = 1
+
+        sess_options = ort.SessionOptions()
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            sess_options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            str(model_path), sess_options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def batch(self, images: list[np.ndarray], batch_size: Optional[int] = None) -> list[list[Layout]]:
+        results = []
+        for image in images:
+            raster, factors = self._layout_raster(image)
+            inputs, (newh, neww) = preprocess(raster, **self.metadata)
+            boxes, classes, scores = self.session.run(
+                ["boxes", "classes", "scores"], {self.input_name: inputs}
+            )
+            # detector_postprocess: clip to the resized page, scale to the page
+            height, width = raster.shape[:2]
+            boxes = boxes.reshape(-1, 4).copy()
+            boxes[:, 0::2] = boxes[:, 0::2].clip(0, neww) * (width / neww)
+            boxes[:, 1::2] = boxes[:, 1::2].clip(0, newh) * (height / newh)
+            boxes /= factors
+            keep = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+            results.append(self._to_layouts(image, classes[keep], boxes[keep], scores[keep]))
+        return results
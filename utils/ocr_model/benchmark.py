@@ -0,0 +1,87 @@
+"""
+Compare the throughput and accuracy of the INT8 OCR models to the FP32 ones.
+
+The FP32 output is the reference: the character error rate (CER) is the
+edit distance between the INT8 and FP32 text of each page, over the number
+of FP32 characters.
+
+Usage:
+    python -m utils.ocr_model.benchmark --pages pages/ --device cpu
+"""
+import argparse
+import time
+from pathlib import Path
+
+from textdistance import levenshtein
+
+from .ocr_model import OCRModel
+from .quantize import load_images
+
+
+def run(ocr_model: OCRModel, images: list, repeat: int = 1) -> tuple[list[str], float, int]:
+    """
+    OCR the pages one by one.
+
+    Returns
+    -------
+    tuple[list[str], float, int]
+        The text of each page, the mean time to OCR all the pages and the
+        number of recognized lines.
+    """
+    # the first run pays for the session warm up / memory arena growth
+    ocr_model.ocr_batch(images[:1])
+    texts, lines, elapsed = [], 0, 0.0
+    for _ in range(repeat):
+        texts, lines = [], 0
+        start = time.perf_counter()
+        for image in images:
+            _, rec_res = ocr_model.ocr_batch([image])[0]
+            rec_res = rec_res or []
+            texts.append("\n".join(text for text, _ in rec_res))
+            lines += len(rec_res)
+        elapsed += time.perf_counter() - start
+    return texts, elapsed / repeat, lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the INT8 OCR models against FP32")
+    parser.add_argument("--pages", type=Path, required=True, help="Directory of page images")
+    parser.add_argument("--model_root_dir", type=Path, default=Path("models/paddle-ocr"))
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--det_limit_side_len",
+        type=int,
+        default=2560,
+        help="Detector input size, the pages are OCRed as a whole",
+    )
+    args = parser.parse_args()
+
+    images = load_images(args.pages)
+    if not images:
+        parser.error(f"No images found in {args.pages}")
+    parameters = {"det_limit_side_len": args.det_limit_side_len}
+
+    results = {}
+    for precision in ["fp32", "int8"]:
+        ocr_model = OCRModel(
+            args.model_root_dir, args.device, parameters=parameters, precision=precision
+        )
+        results[precision] = run(ocr_model, images, args.repeat)
+
+    ref_texts = results["fp32"][0]
+    ref_chars = sum(len(text) for text in ref_texts)
+    print(f"{len(images)} pages, {ref_chars} reference characters")
+    print(f"{'precision':<10}{'pages/s':>10}{'lines/s':>10}{'speedup':>10}{'CER':>10}")
+    for precision, (texts, elapsed, lines) in results.items():
+        errors = sum(levenshtein.distance(text, ref) for text, ref in zip(texts, ref_texts))
+        cer = errors / max(ref_chars, 1)
+        speedup = results["fp32"][1] / elapsed
+        print(
+            f"{precision:<10}{len(images) / elapsed:>10.2f}{lines / elapsed:>10.1f}"
+            f"{speedup:>9.2f}x{cer:>10.2%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import hashlib
 from pathlib import Path
 
 import numpy as np
@@ -11,8 +12,21 @@ class _DictDotNotation(dict):
         self.__dict__ = self
 
 
+def int8_model_path(model_path: Path) -> Path:
+    """
+    Path of the INT8 version of a model, made by `utils.ocr_model.quantize`.
+    """
+    return model_path.with_suffix(".int8.onnx")
+
+
 class OCRModel:
-    def __init__(self, model_root_dir: Path, device: str = "cuda") -> None:
+    def __init__(
+        self,
+        model_root_dir: Path,
+        device: str = "cuda",
+        parameters: dict = None,
+        precision: str = "fp32",
+    ) -> None:
         """
         Initialize OCR model.
 
@@ -22,15 +36,21 @@ class OCRModel:
             Path to the PaddleOCR model root directory.
         device : str, optional
             Device to use, by default "cuda"
+        parameters : dict, optional
+            PaddleOCR parameters overriding the defaults, by default None
+        precision : str, optional
+            "fp32" or "int8" detection and recognition models, by default "fp32"
 
         Raises
         ------
         FileNotFoundError
-            If the model directory is not found.
+            If the model directory is not found, or the INT8 models have not
+            been made.
         """
         self.paddleocr_parameters = self.__get_paddleocr_parameters(
-            model_root_dir, device
+            model_root_dir, device, precision
         )
+        self.paddleocr_parameters.update(parameters or {})
         self.paddleocr = PaddleOcrONNX(self.paddleocr_parameters)
 
     def __call__(self, image: np.ndarray) -> str:
@@ -49,8 +69,48 @@ class OCRModel:
         """
         return self.paddleocr(image)
 
+    def ocr_batch(self, images: list[np.ndarray]) -> list:
+        """
+        Perform OCR on several images, recognizing their lines in shared batches.
+
+        Parameters
+        ----------
+        images : list[np.ndarray]
+            RGB images data
+
+        Returns
+        -------
+        list
+            (boxes, rec_res) of each image
+        """
+        return self.paddleocr.ocr_batch(images)
+
+    def version(self) -> str:
+        """
+        Identify the models and the settings that change the OCR results.
+
+        Returns
+        -------
+        str
+            Hash of the model files and of the detection / recognition
+            parameters.
+        """
+        h = hashlib.blake2b(digest_size=16)
+        params = self.paddleocr_parameters
+        model_dirs = [params.det_model_dir, params.rec_model_dir]
+        if params.use_angle_cls:
+            model_dirs.append(params.cls_model_dir)
+        for model_dir in model_dirs:
+            with open(model_dir, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+        for key in sorted(params):
+            if key.startswith(("det_", "rec_", "cls_", "use_angle_cls", "drop_score")):
+                h.update(f"{key}={params[key]}".encode())
+        return h.hexdigest()
+
     def __get_paddleocr_parameters(
-        self, model_root_dir: Path, device: str
+        self, model_root_dir: Path, device: str, precision: str = "fp32"
     ) -> _DictDotNotation:
         """
         Get parameters for PaddleOCR.
@@ -61,6 +121,8 @@ class OCRModel:
             Path to the PaddleOCR model root directory.
         device : str
             Device to use.
+        precision : str, optional
+            "fp32" or "int8" detection and recognition models, by default "fp32"
 
         Returns
         -------
@@ -69,16 +131,40 @@ class OCRModel:
         """
         paddleocr_parameters = _DictDotNotation()
 
+        def model_path(name: str) -> str:
+            path = model_root_dir / name
+            if precision == "int8":
+                path = int8_model_path(path)
+                if not path.exists():
+                    raise FileNotFoundError(
+                        f"{path} not found, run `python -m utils.ocr_model.quantize` first"
+                    )
+            elif precision != "fp32":
+                raise ValueError(f"Unsupported OCR precision: {precision}")
+            return str(path)
+
         # params for prediction engine
         paddleocr_parameters.use_gpu = True if device == "cuda" else False
+        paddleocr_parameters.precision = precision
+
+        # params for onnxruntime, sessions are shared within the process
+        paddleocr_parameters.ort_intra_op_num_threads = 0
+        paddleocr_parameters.ort_inter_op_num_threads = 0
+        paddleocr_parameters.ort_execution_mode = "sequential"
+        paddleocr_parameters.ort_graph_optimization_level = "all"
+        paddleocr_parameters.ort_optimized_model_dir = None
+        paddleocr_parameters.use_io_binding = False
 
         # params for text detector
         paddleocr_parameters.det_algorithm = "DB"
-        paddleocr_parameters.det_model_dir = str(
-            model_root_dir / "en_PP-OCRv3_det_infer.onnx"
-        )
+        paddleocr_parameters.det_model_dir = model_path("en_PP-OCRv3_det_infer.onnx")
         paddleocr_parameters.det_limit_side_len = 960
         paddleocr_parameters.det_limit_type = "max"
+        # "adaptive" limit: blocks are scaled so that their text is about
+        # det_target_text_height pixels high
+        paddleocr_parameters.det_target_text_height = 24
+        paddleocr_parameters.det_min_scale = 0.5
+        paddleocr_parameters.det_max_scale = 1.0
         paddleocr_parameters.det_box_type = "quad"
 
         # DB parmas
@@ -91,9 +177,7 @@ class OCRModel:
 
         # params for text recognizer
         paddleocr_parameters.rec_algorithm = "SVTR_LCNet"
-        paddleocr_parameters.rec_model_dir = str(
-            model_root_dir / "en_PP-OCRv3_rec_infer.onnx"
-        )
+        paddleocr_parameters.rec_model_dir = model_path("en_PP-OCRv3_rec_infer.onnx")
         paddleocr_parameters.rec_image_shape = "3, 48, 320"
         paddleocr_parameters.rec_batch_num = 6
         paddleocr_parameters.rec_char_dict_path = str(model_root_dir / "en_dict.txt")
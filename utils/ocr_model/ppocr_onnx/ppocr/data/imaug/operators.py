@@ -92,6 +92,32 @@ class NormalizeImage(object):
         return data
 
 
+class NormalizeCHWImage(object):
+    """ NormalizeImage followed by ToCHWImage in a single pass over uint8
+    images: the normalized value of every byte of each channel is looked up
+    in a table computed with the same float32 operations.
+    """
+    def __init__(self, scale=None, mean=None, std=None, **kwargs):
+        self.normalize = NormalizeImage(scale, mean, std, order='hwc')
+        values = np.arange(256, dtype=np.uint8).reshape(256, 1, 1)
+        self.lut = self.normalize({'image': np.repeat(values, 3, axis=2)})[
+            'image'][:, 0, :].T.copy()
+
+    def __call__(self, data):
+        img = data['image']
+        if isinstance(img, Image.Image):
+            img = np.array(img)
+        if img.dtype != np.uint8 or img.ndim != 3 or img.shape[2] != 3:
+            data = self.normalize(data)
+            data['image'] = data['image'].transpose((2, 0, 1))
+            return data
+        out = np.empty((3, ) + img.shape[:2], dtype=np.float32)
+        for c in range(3):
+            np.take(self.lut[c], img[:, :, c], out=out[c])
+        data['image'] = out
+        return data
+
+
 class ToCHWImage(object):
     """ convert hwc image to chw image
     """
@@ -197,6 +223,28 @@ class Resize(object):
         return data
 
 
+def estimate_text_height(img, min_height=4):
+    """
+    Estimate the height of the text lines of a block from the runs of rows
+    containing ink.
+    return:
+        median height of the lines in pixels, None if no line is found
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY) if img.ndim == 3 else img
+    _, ink = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    rows = cv2.reduce(ink, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+    if rows.sum() > ink.size / 2:
+        # light text on a dark background
+        rows = ink.shape[1] - rows
+    has_ink = np.concatenate([[0], rows > 0.01 * ink.shape[1], [0]])
+    edges = np.diff(has_ink.astype(np.int8))
+    heights = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+    heights = heights[heights >= min_height]
+    if len(heights) == 0:
+        return None
+    return float(np.median(heights))
+
+
 class DetResizeForTest(object):
     def __init__(self, **kwargs):
         super(DetResizeForTest, self).__init__()
@@ -210,6 +258,11 @@ class DetResizeForTest(object):
         elif 'limit_side_len' in kwargs:
             self.limit_side_len = kwargs['limit_side_len']
             self.limit_type = kwargs.get('limit_type', 'min')
+            # limit_type 'adaptive': scale the text to target_text_height,
+            # the longest side is still limited to limit_side_len
+            self.target_text_height = kwargs.get('target_text_height', 24)
+            self.min_scale = kwargs.get('min_scale', 0.5)
+            self.max_scale = kwargs.get('max_scale', 1.0)
         elif 'resize_long' in kwargs:
             self.resize_type = 2
             self.resize_long = kwargs.get('resize_long', 960)
@@ -284,6 +337,13 @@ class DetResizeForTest(object):
                 ratio = 1.
         elif self.limit_type == 'resize_long':
             ratio = float(limit_side_len) / max(h, w)
+        elif self.limit_type == 'adaptive':
+            text_height = estimate_text_height(img)
+            ratio = 1.
+            if text_height is not None:
+                ratio = min(max(self.target_text_height / text_height,
+                                self.min_scale), self.max_scale)
+            ratio = min(ratio, float(limit_side_len) / max(h, w))
         else:
             raise Exception('not support limit type, image ')
         resize_h = int(h * ratio)
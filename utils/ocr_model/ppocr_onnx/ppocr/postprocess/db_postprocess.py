@@ -108,7 +108,7 @@ class DBPostProcess(object):
         bitmap = _bitmap
         height, width = bitmap.shape
 
-        outs = cv2.findContours((bitmap * 255).astype(np.uint8), cv2.RETR_LIST,
+        outs = cv2.findContours(bitmap.astype(np.uint8) * 255, cv2.RETR_LIST,
                                 cv2.CHAIN_APPROX_SIMPLE)
         if len(outs) == 3:
             img, contours, _ = outs[0], outs[1], outs[2]
@@ -116,35 +116,51 @@ class DBPostProcess(object):
             contours, _ = outs[0], outs[1]
 
         num_contours = min(len(contours), self.max_candidates)
-
-        boxes = []
-        scores = []
-        for index in range(num_contours):
-            contour = contours[index]
-            points, sside = self.get_mini_boxes(contour)
-            if sside < self.min_size:
-                continue
-            points = np.array(points)
-            if self.score_mode == "fast":
-                score = self.box_score_fast(pred, points.reshape(-1, 2))
-            else:
-                score = self.box_score_slow(pred, contour)
-            if self.box_thresh > score:
-                continue
-
-            box = self.unclip(points, self.unclip_ratio).reshape(-1, 1, 2)
-            box, sside = self.get_mini_boxes(box)
-            if sside < self.min_size + 2:
-                continue
-            box = np.array(box)
-
-            box[:, 0] = np.clip(np.round(box[:, 0] / width * dest_width), 0,
-                                dest_width)
-            box[:, 1] = np.clip(np.round(box[:, 1] / height * dest_height), 0,
-                                dest_height)
-            boxes.append(box.astype("int32"))
-            scores.append(score)
-        return np.array(boxes, dtype="int32"), scores
+        contours = contours[:num_contours]
+        if num_contours == 0:
+            return np.zeros((0, 4, 2), dtype="int32"), []
+
+        points, sside = self.get_mini_boxes_batch(contours)
+        keep = np.flatnonzero(sside >= self.min_size)
+        if self.score_mode == "fast":
+            scores = self.box_score_fast_batch(pred, points[keep])
+        else:
+            scores = np.array(
+                [self.box_score_slow(pred, contours[i]) for i in keep])
+        passed = scores >= self.box_thresh
+        keep, scores = keep[passed], scores[passed]
+
+        expanded = self.unclip_batch(points[keep], self.unclip_ratio)
+        box, sside = self.get_mini_boxes_batch(
+            [poly.reshape(-1, 1, 2) for poly in expanded])
+        big = sside >= self.min_size + 2
+        box, scores = box[big], scores[big]
+
+        box[:, :, 0] = np.clip(np.round(box[:, :, 0] / width * dest_width), 0,
+                               dest_width)
+        box[:, :, 1] = np.clip(
+            np.round(box[:, :, 1] / height * dest_height), 0, dest_height)
+        return box.astype("int32"), scores.tolist()
+
+    def unclip_batch(self, boxes, unclip_ratio):
+        """
+        unclip the (N, 4, 2) quads, the offset distance of all the quads is
+        computed at once instead of with a shapely Polygon per box
+        """
+        if len(boxes) == 0:
+            return []
+        boxes = boxes.astype(np.float64)
+        x, y = boxes[:, :, 0], boxes[:, :, 1]
+        x1, y1 = np.roll(x, -1, axis=1), np.roll(y, -1, axis=1)
+        area = np.abs((x * y1 - x1 * y).sum(axis=1)) / 2
+        length = np.hypot(x1 - x, y1 - y).sum(axis=1)
+        distance = area * unclip_ratio / length
+        expanded = []
+        for box, dist in zip(boxes, distance):
+            offset = pyclipper.PyclipperOffset()
+            offset.AddPath(box, pyclipper.JT_ROUND, pyclipper.ET_CLOSEDPOLYGON)
+            expanded.append(np.array(offset.Execute(dist)))
+        return expanded
 
     def unclip(self, box, unclip_ratio):
         poly = Polygon(box)
@@ -177,6 +193,59 @@ class DBPostProcess(object):
         ]
         return box, min(bounding_box[1])
 
+    def get_mini_boxes_batch(self, contours):
+        """
+        get_mini_boxes of several contours.
+        return:
+            boxes (N, 4, 2) float32 and their short side (N,)
+        """
+        rects = [cv2.minAreaRect(contour) for contour in contours]
+        if not rects:
+            return np.zeros((0, 4, 2), dtype=np.float32), np.zeros(0)
+        points = np.stack([cv2.boxPoints(rect) for rect in rects])
+        sside = np.array([min(rect[1]) for rect in rects])
+
+        # sort the points by x (stable, as sorted()), then the left pair
+        # top / bottom and the right pair top / bottom
+        order = np.argsort(points[:, :, 0], axis=1, kind="stable")
+        points = np.take_along_axis(points, order[:, :, None], axis=1)
+        rows = np.arange(len(points))[:, None]
+        left_down = points[:, 1, 1] > points[:, 0, 1]
+        right_down = points[:, 3, 1] > points[:, 2, 1]
+        index = np.empty((len(points), 4), dtype=np.int64)
+        index[:, 0] = np.where(left_down, 0, 1)
+        index[:, 3] = np.where(left_down, 1, 0)
+        index[:, 1] = np.where(right_down, 2, 3)
+        index[:, 2] = np.where(right_down, 3, 2)
+        return points[rows, index], sside
+
+    def box_score_fast_batch(self, bitmap, boxes):
+        """
+        box_score_fast of the (N, 4, 2) boxes. The bounding boxes and the
+        shifted polygons of all the boxes are computed at once, only the
+        mask filling and the masked mean are left per box.
+        """
+        n = len(boxes)
+        scores = np.zeros(n)
+        if n == 0:
+            return scores
+        h, w = bitmap.shape[:2]
+        xmin = np.clip(np.floor(boxes[:, :, 0].min(axis=1)), 0, w - 1).astype("int32")
+        xmax = np.clip(np.ceil(boxes[:, :, 0].max(axis=1)), 0, w - 1).astype("int32")
+        ymin = np.clip(np.floor(boxes[:, :, 1].min(axis=1)), 0, h - 1).astype("int32")
+        ymax = np.clip(np.ceil(boxes[:, :, 1].max(axis=1)), 0, h - 1).astype("int32")
+        polys = boxes.copy()
+        polys[:, :, 0] -= xmin[:, None]
+        polys[:, :, 1] -= ymin[:, None]
+        polys = polys.astype("int32")
+
+        bounds = zip(xmin.tolist(), xmax.tolist(), ymin.tolist(), ymax.tolist())
+        for i, (x0, x1, y0, y1) in enumerate(bounds):
+            mask = np.zeros((y1 - y0 + 1, x1 - x0 + 1), dtype=np.uint8)
+            cv2.fillPoly(mask, polys[i][None], 1)
+            scores[i] = cv2.mean(bitmap[y0:y1 + 1, x0:x1 + 1], mask)[0]
+        return scores
+
     def box_score_fast(self, bitmap, _box):
         '''
         box_score_fast: use bbox mean score as the mean score
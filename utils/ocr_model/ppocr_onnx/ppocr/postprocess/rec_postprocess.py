@@ -99,6 +99,64 @@ class BaseRecLabelDecode(object):
     def get_ignored_tokens(self):
         return [0]  # for ctc blank
 
+    def _get_codepoints(self):
+        """
+        Code point of every character of the dictionary, None if an entry
+        that can be decoded is not a single character.
+        """
+        if not hasattr(self, '_codepoints'):
+            ignored_tokens = set(self.get_ignored_tokens())
+            codepoints = np.zeros(len(self.character), dtype='<u4')
+            for i, char in enumerate(self.character):
+                if len(char) == 1:
+                    codepoints[i] = ord(char)
+                elif i not in ignored_tokens:
+                    codepoints = None
+                    break
+            self._codepoints = codepoints
+            self._char_objects = np.array(self.character, dtype=object)
+        return self._codepoints
+
+    def decode_batch(self, text_index, text_prob, is_remove_duplicate=False):
+        """ decode of the whole (B, T) batch at once, same output as decode """
+        text_index = np.asarray(text_index)
+        text_prob = np.asarray(text_prob)
+        selection = np.ones(text_index.shape, dtype=bool)
+        if is_remove_duplicate:
+            selection[:, 1:] = text_index[:, 1:] != text_index[:, :-1]
+        for ignored_token in self.get_ignored_tokens():
+            selection &= text_index != ignored_token
+
+        counts = selection.sum(axis=1)
+        ends = np.cumsum(counts)
+        starts = ends - counts
+        chars = text_index[selection]
+        probs = text_prob[selection]
+
+        codepoints = self._get_codepoints()
+        bounds = list(zip(starts.tolist(), ends.tolist()))
+        if codepoints is not None:
+            flat = codepoints[chars].tobytes().decode('utf-32-le')
+            texts = [flat[beg:end] for beg, end in bounds]
+        else:
+            flat = self._char_objects[chars]
+            texts = [''.join(flat[beg:end]) for beg, end in bounds]
+        if self.reverse:  # for arabic rec
+            texts = [self.pred_reverse(text) for text in texts]
+
+        # the rows with the same number of characters are averaged together,
+        # each row is reduced exactly as np.mean(conf_list) does
+        confs = [0.0] * len(texts)
+        for count in np.unique(counts).tolist():
+            if count == 0:
+                continue
+            rows = np.flatnonzero(counts == count)
+            index = starts[rows][:, None] + np.arange(count)
+            for row, conf in zip(rows.tolist(),
+                                 np.mean(probs[index], axis=1).tolist()):
+                confs[row] = conf
+        return list(zip(texts, confs))
+
 
 class CTCLabelDecode(BaseRecLabelDecode):
     """ Convert between text-label and text-index """
@@ -113,8 +171,9 @@ class CTCLabelDecode(BaseRecLabelDecode):
         if isinstance(preds, tuple) or isinstance(preds, list):
             preds = preds[-1]
         preds_idx = preds.argmax(axis=2)
-        preds_prob = preds.max(axis=2)
-        text = self.decode(preds_idx, preds_prob, is_remove_duplicate=True)
+        preds_prob = np.take_along_axis(preds, preds_idx[:, :, None],
+                                        axis=2)[:, :, 0]
+        text = self.decode_batch(preds_idx, preds_prob, is_remove_duplicate=True)
         if label is None:
             return text
         label = self.decode(label)
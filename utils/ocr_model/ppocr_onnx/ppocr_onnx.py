@@ -1,4 +1,3 @@
-import copy
 import os
 import time
 
@@ -6,7 +5,11 @@ import cv2
 
 from .tools.infer import predict_cls, predict_det
 from .tools.infer import predict_rec as predict_rec
-from .tools.infer.utility import get_minarea_rect_crop, get_rotate_crop_image
+from .tools.infer.utility import (
+    get_minarea_rect_crop,
+    get_rotate_crop_image,
+    sorted_boxes,
+)
 
 
 class PaddleOcrONNX(object):
@@ -36,26 +39,44 @@ class PaddleOcrONNX(object):
             )
         self.crop_image_res_index += bbox_num
 
-    def __call__(self, img, cls=True):
-        time_dict = {"det": 0, "rec": 0, "csl": 0, "all": 0}
-        start = time.time()
-        ori_im = img.copy()
+    def detect(self, img):
+        """
+        Detect the text lines of an image and crop them, sorted in reading order
+        """
         dt_boxes, elapse = self.text_detector(img)
-        time_dict["det"] = elapse
-
         if dt_boxes is None:
-            return None, None
-        img_crop_list = []
+            return None, [], elapse
 
         dt_boxes = self.sorted_boxes(dt_boxes)
 
-        for bno in range(len(dt_boxes)):
-            tmp_box = copy.deepcopy(dt_boxes[bno])
+        # neither the detector nor the crops modify the image or the boxes,
+        # axis-aligned crops are views of the image
+        img_crop_list = []
+        for box in dt_boxes:
             if self.args.det_box_type == "quad":
-                img_crop = get_rotate_crop_image(ori_im, tmp_box)
+                img_crop = get_rotate_crop_image(img, box)
             else:
-                img_crop = get_minarea_rect_crop(ori_im, tmp_box)
+                img_crop = get_minarea_rect_crop(img, box)
             img_crop_list.append(img_crop)
+        return dt_boxes, img_crop_list, elapse
+
+    def filter_results(self, dt_boxes, rec_res):
+        filter_boxes, filter_rec_res = [], []
+        for box, rec_result in zip(dt_boxes, rec_res):
+            text, score = rec_result
+            if score >= self.drop_score:
+                filter_boxes.append(box)
+                filter_rec_res.append(rec_result)
+        return filter_boxes, filter_rec_res
+
+    def __call__(self, img, cls=True):
+        time_dict = {"det": 0, "rec": 0, "csl": 0, "all": 0}
+        start = time.time()
+        dt_boxes, img_crop_list, elapse = self.detect(img)
+        time_dict["det"] = elapse
+
+        if dt_boxes is None:
+            return None, None
         if self.use_angle_cls and cls:
             img_crop_list, angle_list, elapse = self.text_classifier(img_crop_list)
             time_dict["cls"] = elapse
@@ -64,16 +85,39 @@ class PaddleOcrONNX(object):
         time_dict["rec"] = elapse
         if self.args.save_crop_res:
             self.draw_crop_rec_res(self.args.crop_res_save_dir, img_crop_list, rec_res)
-        filter_boxes, filter_rec_res = [], []
-        for box, rec_result in zip(dt_boxes, rec_res):
-            text, score = rec_result
-            if score >= self.drop_score:
-                filter_boxes.append(box)
-                filter_rec_res.append(rec_result)
+        filter_boxes, filter_rec_res = self.filter_results(dt_boxes, rec_res)
         end = time.time()
         time_dict["all"] = end - start
         return filter_boxes, filter_rec_res, time_dict
 
+    def ocr_batch(self, imgs, cls=True):
+        """
+        OCR several images (blocks of a page, or several pages) at once.
+        The lines of all the images are recognized together in width-sorted
+        batches of `rec_batch_num` instead of per image.
+        return:
+            list of (boxes, rec_res) for each image, (None, None) if nothing detected
+        """
+        queue = RecognitionQueue(self.text_recognizer)
+        detections = []
+        for img in imgs:
+            dt_boxes, img_crop_list, _ = self.detect(img)
+            if dt_boxes is None:
+                detections.append((None, None))
+                continue
+            if self.use_angle_cls and cls:
+                img_crop_list, _, _ = self.text_classifier(img_crop_list)
+            detections.append((dt_boxes, queue.put(img_crop_list)))
+        rec_results = queue.flush()
+
+        results = []
+        for dt_boxes, ticket in detections:
+            if dt_boxes is None:
+                results.append((None, None))
+            else:
+                results.append(self.filter_results(dt_boxes, rec_results[ticket]))
+        return results
+
     def sorted_boxes(self, dt_boxes):
         """
         Sort text boxes in order from top to bottom, left to right
@@ -82,18 +126,36 @@ class PaddleOcrONNX(object):
         return:
             sorted boxes(array) with shape [4, 2]
         """
-        num_boxes = dt_boxes.shape[0]
-        sorted_boxes = sorted(dt_boxes, key=lambda x: (x[0][1], x[0][0]))
-        _boxes = list(sorted_boxes)
-
-        for i in range(num_boxes - 1):
-            for j in range(i, -1, -1):
-                if abs(_boxes[j + 1][0][1] - _boxes[j][0][1]) < 10 and (
-                    _boxes[j + 1][0][0] < _boxes[j][0][0]
-                ):
-                    tmp = _boxes[j]
-                    _boxes[j] = _boxes[j + 1]
-                    _boxes[j + 1] = tmp
-                else:
-                    break
-        return _boxes
+        return sorted_boxes(dt_boxes)
+
+
+class RecognitionQueue(object):
+    """
+    Collect text line crops from many owners (blocks, pages) and recognize
+    them in shared batches. TextRecognizer sorts all the crops by aspect
+    ratio before batching, so each batch holds lines of similar width and
+    little padding; the results are scattered back to their owners.
+    """
+
+    def __init__(self, text_recognizer):
+        self.text_recognizer = text_recognizer
+        self.img_crop_list = []
+        self.sizes = []
+
+    def put(self, img_crop_list):
+        """Queue the crops of one owner, return its ticket for `flush`"""
+        self.img_crop_list.extend(img_crop_list)
+        self.sizes.append(len(img_crop_list))
+        return len(self.sizes) - 1
+
+    def flush(self):
+        """Recognize every queued crop, return the results of each ticket"""
+        rec_res = []
+        if self.img_crop_list:
+            rec_res, _ = self.text_recognizer(self.img_crop_list)
+        results, beg = [], 0
+        for size in self.sizes:
+            results.append(rec_res[beg:beg + size])
+            beg += size
+        self.img_crop_list, self.sizes = [], []
+        return results
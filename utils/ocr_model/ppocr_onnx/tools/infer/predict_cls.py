@@ -47,6 +47,8 @@ class TextClassifier(object):
         self.postprocess_op = build_post_process(postprocess_params)
         self.predictor, self.input_tensor, self.output_tensors, _ = \
             utility.create_predictor(args, 'cls', logger)
+        self.io_binding = utility.create_io_binding(args, self.predictor,
+                                                    self.input_tensor)
         self.use_onnx = args.use_onnx
 
     def resize_norm_img(self, img):
@@ -101,7 +103,9 @@ class TextClassifier(object):
             norm_img_batch = np.concatenate(norm_img_batch)
             norm_img_batch = norm_img_batch.copy()
 
-            if self.use_onnx:
+            if self.io_binding is not None:
+                prob_out = self.io_binding.run(norm_img_batch)[0]
+            elif self.use_onnx:
                 input_dict = {}
                 input_dict[self.input_tensor.name] = norm_img_batch
                 outputs = self.predictor.run(self.output_tensors, input_dict)
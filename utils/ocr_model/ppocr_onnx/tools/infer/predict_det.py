@@ -43,16 +43,16 @@ class TextDetector(object):
             'DetResizeForTest': {
                 'limit_side_len': args.det_limit_side_len,
                 'limit_type': args.det_limit_type,
+                'target_text_height': args.det_target_text_height,
+                'min_scale': args.det_min_scale,
+                'max_scale': args.det_max_scale,
             }
         }, {
-            'NormalizeImage': {
+            'NormalizeCHWImage': {
                 'std': [0.229, 0.224, 0.225],
                 'mean': [0.485, 0.456, 0.406],
                 'scale': '1./255.',
-                'order': 'hwc'
             }
-        }, {
-            'ToCHWImage': None
         }, {
             'KeepKeys': {
                 'keep_keys': ['image', 'shape']
@@ -78,12 +78,11 @@ class TextDetector(object):
             postprocess_params["score_mode"] = args.det_db_score_mode
             postprocess_params["box_type"] = args.det_box_type
             pre_process_list[1] = {
-                'NormalizeImage': {
+                'NormalizeCHWImage': {
                     'std': [1.0, 1.0, 1.0],
                     'mean':
                     [0.48109378172549, 0.45752457890196, 0.40787054090196],
                     'scale': '1./255.',
-                    'order': 'hwc'
                 }
             }
         elif self.det_algorithm == "EAST":
@@ -140,6 +139,8 @@ class TextDetector(object):
         self.postprocess_op = build_post_process(postprocess_params)
         self.predictor, self.input_tensor, self.output_tensors, self.config = utility.create_predictor(
             args, 'det', logger)
+        self.io_binding = utility.create_io_binding(args, self.predictor,
+                                                    self.input_tensor)
 
         self.preprocess_op = create_operators(pre_process_list)
 
@@ -180,21 +181,46 @@ class TextDetector(object):
             points[pno, 1] = int(min(max(points[pno, 1], 0), img_height - 1))
         return points
 
+    def order_points_clockwise_batch(self, boxes):
+        """
+        order_points_clockwise of (N, 4, 2) boxes
+        """
+        boxes = boxes.astype("float32")
+        rows = np.arange(len(boxes))
+        s = boxes.sum(axis=2)
+        first, third = np.argmin(s, axis=1), np.argmax(s, axis=1)
+        # the two remaining points of each box, in their original order
+        rest = np.ones(s.shape, dtype=bool)
+        rest[rows, first] = False
+        rest[rows, third] = False
+        degenerate = rest.sum(axis=1) != 2
+        rest[degenerate] = False
+        rest[degenerate, :2] = True
+        tmp = boxes[rest].reshape(-1, 2, 2)
+        diff = tmp[:, :, 1] - tmp[:, :, 0]
+        rect = np.empty_like(boxes)
+        rect[:, 0] = boxes[rows, first]
+        rect[:, 2] = boxes[rows, third]
+        rect[:, 1] = tmp[rows, np.argmin(diff, axis=1)]
+        rect[:, 3] = tmp[rows, np.argmax(diff, axis=1)]
+        # all the points have the same x + y, np.delete drops a single point
+        for i in np.flatnonzero(degenerate):
+            rect[i] = self.order_points_clockwise(boxes[i])
+        return rect
+
     def filter_tag_det_res(self, dt_boxes, image_shape):
         img_height, img_width = image_shape[0:2]
-        dt_boxes_new = []
-        for box in dt_boxes:
-            if type(box) is list:
-                box = np.array(box)
-            box = self.order_points_clockwise(box)
-            box = self.clip_det_res(box, img_height, img_width)
-            rect_width = int(np.linalg.norm(box[0] - box[1]))
-            rect_height = int(np.linalg.norm(box[0] - box[3]))
-            if rect_width <= 3 or rect_height <= 3:
-                continue
-            dt_boxes_new.append(box)
-        dt_boxes = np.array(dt_boxes_new)
-        return dt_boxes
+        if len(dt_boxes) == 0:
+            return np.array([])
+        boxes = self.order_points_clockwise_batch(np.asarray(dt_boxes))
+        boxes[:, :, 0] = np.floor(np.clip(boxes[:, :, 0], 0, img_width - 1))
+        boxes[:, :, 1] = np.floor(np.clip(boxes[:, :, 1], 0, img_height - 1))
+        rect_width = np.linalg.norm(boxes[:, 0] - boxes[:, 1], axis=1).astype(int)
+        rect_height = np.linalg.norm(boxes[:, 0] - boxes[:, 3], axis=1).astype(int)
+        boxes = boxes[(rect_width > 3) & (rect_height > 3)]
+        if len(boxes) == 0:
+            return np.array([])
+        return boxes
 
     def filter_tag_det_res_only_clip(self, dt_boxes, image_shape):
         img_height, img_width = image_shape[0:2]
@@ -208,7 +234,8 @@ class TextDetector(object):
         return dt_boxes
 
     def __call__(self, img):
-        ori_im = img.copy()
+        # the preprocessing does not modify the image, only its shape is kept
+        ori_shape = img.shape
         data = {'image': img}
 
         st = time.time()
@@ -222,11 +249,13 @@ class TextDetector(object):
             return None, 0
         img = np.expand_dims(img, axis=0)
         shape_list = np.expand_dims(shape_list, axis=0)
-        img = img.copy()
+        img = np.ascontiguousarray(img)
 
         if self.args.benchmark:
             self.autolog.times.stamp()
-        if self.use_onnx:
+        if self.io_binding is not None:
+            outputs = self.io_binding.run(img)
+        elif self.use_onnx:
             input_dict = {}
             input_dict[self.input_tensor.name] = img
             outputs = self.predictor.run(self.output_tensors, input_dict)
@@ -265,9 +294,9 @@ class TextDetector(object):
 
         if self.args.det_box_type == 'poly':
             dt_boxes = self.filter_tag_det_res_only_clip(
-                dt_boxes, ori_im.shape)
+                dt_boxes, ori_shape)
         else:
-            dt_boxes = self.filter_tag_det_res(dt_boxes, ori_im.shape)
+            dt_boxes = self.filter_tag_det_res(dt_boxes, ori_shape)
 
         if self.args.benchmark:
             self.autolog.times.end(stamp=True)
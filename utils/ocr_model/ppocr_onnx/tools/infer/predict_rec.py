@@ -41,6 +41,11 @@ class TextRecognizer(object):
         ]
         self.rec_batch_num = args.rec_batch_num
         self.rec_algorithm = args.rec_algorithm
+        # algorithms with their own preprocessing or input width
+        self.unbatched_algorithms = [
+            "SAR", "SRN", "SVTR", "VisionLAN", "PREN", "SPIN", "ABINet",
+            "RobustScanner", "CAN", "NRTR", "ViTSTR", "RFL", "RARE"
+        ]
         postprocess_params = {
             'name': 'CTCLabelDecode',
             "character_dict_path": args.rec_char_dict_path,
@@ -119,6 +124,8 @@ class TextRecognizer(object):
         self.postprocess_op = build_post_process(postprocess_params)
         self.predictor, self.input_tensor, self.output_tensors, self.config = \
             utility.create_predictor(args, 'rec', logger)
+        self.io_binding = utility.create_io_binding(args, self.predictor,
+                                                    self.input_tensor)
         self.benchmark = args.benchmark
         self.use_onnx = args.use_onnx
         if args.benchmark:
@@ -141,7 +148,11 @@ class TextRecognizer(object):
                 warmup=0,
                 logger=logger)
 
-    def resize_norm_img(self, img, max_wh_ratio):
+    def resize_norm_img(self, img, max_wh_ratio, out=None):
+        """
+        out: optional (imgC, imgH, imgH * max_wh_ratio) zeroed slice of the
+            batch, the normalized image is written into it
+        """
         imgC, imgH, imgW = self.rec_image_shape
         if self.rec_algorithm == 'NRTR' or self.rec_algorithm == 'ViTSTR':
             img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
@@ -184,6 +195,13 @@ class TextRecognizer(object):
                 resized_w = self.rec_image_shape[2]
             imgW = self.rec_image_shape[2]
         resized_image = cv2.resize(img, (resized_w, imgH))
+        if out is not None:
+            dst = out[:, :, 0:resized_w]
+            np.divide(resized_image.transpose((2, 0, 1)), np.float32(255),
+                      out=dst, dtype=np.float32)
+            dst -= 0.5
+            dst /= 0.5
+            return out
         resized_image = resized_image.astype('float32')
         resized_image = resized_image.transpose((2, 0, 1)) / 255
         resized_image -= 0.5
@@ -411,6 +429,13 @@ class TextRecognizer(object):
                 h, w = img_list[indices[ino]].shape[0:2]
                 wh_ratio = w * 1.0 / h
                 max_wh_ratio = max(max_wh_ratio, wh_ratio)
+            # the default resize normalizes each line straight into the batch
+            batch_buffer = None
+            if self.rec_algorithm not in self.unbatched_algorithms:
+                batch_buffer = np.zeros(
+                    (end_img_no - beg_img_no, imgC, imgH,
+                     int(imgH * max_wh_ratio)),
+                    dtype=np.float32)
             for ino in range(beg_img_no, end_img_no):
                 if self.rec_algorithm == "SAR":
                     norm_img, _, _, valid_ratio = self.resize_norm_img_sar(
@@ -473,13 +498,19 @@ class TextRecognizer(object):
                     word_label_list = []
                     norm_img_mask_batch.append(norm_image_mask)
                     word_label_list.append(word_label)
+                elif batch_buffer is not None:
+                    self.resize_norm_img(img_list[indices[ino]],
+                                         max_wh_ratio,
+                                         out=batch_buffer[ino - beg_img_no])
                 else:
                     norm_img = self.resize_norm_img(img_list[indices[ino]],
                                                     max_wh_ratio)
                     norm_img = norm_img[np.newaxis, :]
                     norm_img_batch.append(norm_img)
-            norm_img_batch = np.concatenate(norm_img_batch)
-            norm_img_batch = norm_img_batch.copy()
+            if batch_buffer is not None:
+                norm_img_batch = batch_buffer
+            else:
+                norm_img_batch = np.concatenate(norm_img_batch)
             if self.benchmark:
                 self.autolog.times.stamp()
 
@@ -597,7 +628,10 @@ class TextRecognizer(object):
                         self.autolog.times.stamp()
                     preds = outputs
             else:
-                if self.use_onnx:
+                if self.io_binding is not None:
+                    outputs = self.io_binding.run(norm_img_batch)
+                    preds = outputs[0]
+                elif self.use_onnx:
                     input_dict = {}
                     input_dict[self.input_tensor.name] = norm_img_batch
                     outputs = self.predictor.run(self.output_tensors,
@@ -22,6 +22,7 @@ import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 import math
 import random
+import threading
 
 
 def str2bool(v):
@@ -48,6 +49,10 @@ def init_args():
     parser.add_argument("--det_model_dir", type=str)
     parser.add_argument("--det_limit_side_len", type=float, default=960)
     parser.add_argument("--det_limit_type", type=str, default='max')
+    # limit_type 'adaptive': scale blocks so their text is this many pixels high
+    parser.add_argument("--det_target_text_height", type=float, default=24)
+    parser.add_argument("--det_min_scale", type=float, default=0.5)
+    parser.add_argument("--det_max_scale", type=float, default=1.0)
     parser.add_argument("--det_box_type", type=str, default='quad')
 
     # DB parmas
@@ -144,6 +149,14 @@ def init_args():
 
     parser.add_argument("--show_log", type=str2bool, default=True)
     parser.add_argument("--use_onnx", type=str2bool, default=False)
+
+    # params for onnxruntime
+    parser.add_argument("--ort_intra_op_num_threads", type=int, default=0)
+    parser.add_argument("--ort_inter_op_num_threads", type=int, default=0)
+    parser.add_argument("--ort_execution_mode", type=str, default='sequential')
+    parser.add_argument("--ort_graph_optimization_level", type=str, default='all')
+    parser.add_argument("--ort_optimized_model_dir", type=str, default=None)
+    parser.add_argument("--use_io_binding", type=str2bool, default=False)
     return parser
 
 
@@ -176,7 +189,6 @@ def create_predictor(args, mode, logger):
         logger.info("not find {} model file path {}".format(mode, model_dir))
         sys.exit(0)
     if args.use_onnx:
-        import onnxruntime as ort
         model_file_path = model_dir
         if not os.path.exists(model_file_path):
             raise ValueError(
@@ -184,11 +196,122 @@ def create_predictor(args, mode, logger):
         providers = ['CPUExecutionProvider']
         if args.use_gpu:
             providers = ['CUDAExecutionProvider', 'CPUExecutionProvider']
+        sess = get_onnx_session(args, model_file_path, providers, logger)
+        return sess, sess.get_inputs()[0], None, None
+
+
+# onnxruntime sessions are shared by every predictor of the process
+_onnx_sessions = {}
+_onnx_sessions_lock = threading.Lock()
+
+
+def _ort_option(args, name, default):
+    return getattr(args, name, default)
+
+
+def create_session_options(args):
+    import onnxruntime as ort
+    opt_levels = {
+        'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }
+    execution_modes = {
+        'sequential': ort.ExecutionMode.ORT_SEQUENTIAL,
+        'parallel': ort.ExecutionMode.ORT_PARALLEL,
+    }
+    sess_options = ort.SessionOptions()
+    # 0 lets onnxruntime pick the number of physical cores
+    sess_options.intra_op_num_threads = _ort_option(
+        args, 'ort_intra_op_num_threads', 0)
+    sess_options.inter_op_num_threads = _ort_option(
+        args, 'ort_inter_op_num_threads', 0)
+    sess_options.execution_mode = execution_modes[_ort_option(
+        args, 'ort_execution_mode', 'sequential')]
+    sess_options.graph_optimization_level = opt_levels[_ort_option(
+        args, 'ort_graph_optimization_level', 'all')]
+    return sess_options
+
+
+def get_onnx_session(args, model_file_path, providers, logger):
+    """
+    Get the onnxruntime session of a model, creating it once per process.
+
+    With `ort_optimized_model_dir`, the graph optimized by onnxruntime is
+    saved on the first run and loaded without optimization afterwards.
+    """
+    import onnxruntime as ort
+    sess_options = create_session_options(args)
+    key = (os.path.abspath(model_file_path), tuple(providers),
+           sess_options.intra_op_num_threads,
+           sess_options.inter_op_num_threads, sess_options.execution_mode,
+           sess_options.graph_optimization_level)
+    with _onnx_sessions_lock:
+        if key in _onnx_sessions:
+            return _onnx_sessions[key]
+
+        optimized_model_dir = _ort_option(args, 'ort_optimized_model_dir', None)
+        if optimized_model_dir is not None:
+            # optimized graphs depend on the execution provider, level and version
+            name, _ = os.path.splitext(os.path.basename(model_file_path))
+            optimized_model_path = os.path.join(
+                optimized_model_dir, "{}.{}.{}.{}.onnx".format(
+                    name, providers[0], _ort_option(
+                        args, 'ort_graph_optimization_level', 'all'),
+                    ort.__version__))
+            if os.path.exists(optimized_model_path):
+                model_file_path = optimized_model_path
+                sess_options.graph_optimization_level = \
+                    ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+            else:
+                os.makedirs(optimized_model_dir, exist_ok=True)
+                sess_options.optimized_model_filepath = optimized_model_path
+
+        logger.info("create onnxruntime session for {}".format(model_file_path))
         sess = ort.InferenceSession(
             model_file_path,
+            sess_options=sess_options,
             providers=providers,
         )
-        return sess, sess.get_inputs()[0], None, None
+        _onnx_sessions[key] = sess
+        return sess
+
+
+class IOBindingRunner(object):
+    """
+    Run a single input onnxruntime session through IO binding, reusing the
+    input buffer while the input shape does not change.
+    """
+
+    def __init__(self, sess, input_name, device='cpu'):
+        self.sess = sess
+        self.input_name = input_name
+        self.device = device
+        self.binding = sess.io_binding()
+        self.input_value = None
+
+    def run(self, inputs):
+        import onnxruntime as ort
+        inputs = np.ascontiguousarray(inputs)
+        if self.input_value is not None and \
+                tuple(self.input_value.shape()) == inputs.shape:
+            self.input_value.update_inplace(inputs)
+        else:
+            self.input_value = ort.OrtValue.ortvalue_from_numpy(
+                inputs, self.device)
+        self.binding.bind_ortvalue_input(self.input_name, self.input_value)
+        for output in self.sess.get_outputs():
+            self.binding.bind_output(output.name, 'cpu')
+        self.sess.run_with_iobinding(self.binding)
+        return self.binding.copy_outputs_to_cpu()
+
+
+def create_io_binding(args, predictor, input_tensor):
+    if not _ort_option(args, 'use_io_binding', False):
+        return None
+    device = 'cuda' if args.use_gpu else 'cpu'
+    return IOBindingRunner(predictor, input_tensor.name, device)
 
 
 def get_output_tensors(args, mode, predictor):
@@ -495,6 +618,71 @@ def draw_boxes(image, boxes, scores=None, drop_score=0.5):
     return image
 
 
+def sorted_boxes(dt_boxes, row_thresh=10):
+    """
+    Sort text boxes in order from top to bottom, left to right
+    The boxes sorted by their top left corner are split into rows where two
+    consecutive corners are at least `row_thresh` apart vertically, no box
+    can cross such a gap. Rows spanning less than `row_thresh` are sorted by
+    x, the (rare) taller rows keep the insertion pass of the original
+    PaddleOCR implementation, so the order is the same.
+    args:
+        dt_boxes(array):detected text boxes with shape [N, 4, 2]
+    return:
+        sorted boxes(list) of arrays with shape [4, 2]
+    """
+    if len(dt_boxes) == 0:
+        return []
+    x = np.asarray([box[0][0] for box in dt_boxes])
+    y = np.asarray([box[0][1] for box in dt_boxes])
+    order = np.lexsort((x, y))
+    breaks = np.flatnonzero(~(np.abs(np.diff(y[order])) < row_thresh)) + 1
+
+    rows = []
+    for row in np.split(order, breaks):
+        if y[row[-1]] - y[row[0]] < row_thresh:
+            rows.append(row[np.argsort(x[row], kind="stable")])
+        else:
+            rows.append(_insertion_pass(row, x, y, row_thresh))
+    return [dt_boxes[i] for i in np.concatenate(rows)]
+
+
+def _insertion_pass(row, x, y, row_thresh):
+    row = list(row)
+    for i in range(len(row) - 1):
+        for j in range(i, -1, -1):
+            if abs(y[row[j + 1]] - y[row[j]]) < row_thresh and \
+                    x[row[j + 1]] < x[row[j]]:
+                row[j], row[j + 1] = row[j + 1], row[j]
+            else:
+                break
+    return np.array(row)
+
+
+def get_axis_aligned_crop(img, points):
+    """
+    Crop of an axis-aligned box with integer corners, ordered clockwise from
+    the top left, as a view of the image. The perspective warp of such a box
+    is a pure translation and gives the same pixels.
+    return:
+        the crop, None if the box is rotated or not inside the image
+    """
+    (left, top), (right, top_r), (right_b, bottom), (left_b, bottom_l) = points
+    if not (top == top_r and right == right_b and bottom == bottom_l and
+            left == left_b):
+        return None
+    if not np.all(points == np.floor(points)):
+        return None
+    left, top, right, bottom = int(left), int(top), int(right), int(bottom)
+    img_height, img_width = img.shape[0:2]
+    if not (0 <= left < right <= img_width and 0 <= top < bottom <= img_height):
+        return None
+    img_crop = img[top:bottom, left:right]
+    if (bottom - top) * 1.0 / (right - left) >= 1.5:
+        img_crop = np.rot90(img_crop)
+    return img_crop
+
+
 def get_rotate_crop_image(img, points):
     '''
     img_height, img_width = img.shape[0:2]
@@ -507,6 +695,9 @@ def get_rotate_crop_image(img, points):
     points[:, 1] = points[:, 1] - top
     '''
     assert len(points) == 4, "shape of points must be 4*2"
+    img_crop = get_axis_aligned_crop(img, points)
+    if img_crop is not None:
+        return img_crop
     img_crop_width = int(
         max(np.linalg.norm(points[0] - points[1]),
             np.linalg.norm(points[2] - points[3])))
@@ -0,0 +1,183 @@
+"""
+Produce INT8 versions of the PaddleOCR detection and recognition models.
+
+The quantized models are written next to the FP32 ones as
+`<name>.int8.onnx` and are picked up with `precision: int8` in the ocr
+section of config.yaml.
+
+Dynamic quantization only needs the models and mostly speeds up the
+recognizer (MatMul / attention). The detector is convolutional, its dynamic
+version runs ConvInteger which is usually slower than FP32 on CPU: use
+static quantization calibrated on a few representative pages for it.
+Check the result with `python -m utils.ocr_model.benchmark`.
+
+Usage:
+    python -m utils.ocr_model.quantize --mode dynamic
+    python -m utils.ocr_model.quantize --mode static --calibration_dir pages/
+"""
+import argparse
+import tempfile
+from pathlib import Path
+
+import cv2
+import numpy as np
+import onnx
+from onnx import version_converter
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    QuantFormat,
+    QuantType,
+    quant_pre_process,
+    quantize_dynamic,
+    quantize_static,
+)
+
+from .ocr_model import OCRModel, int8_model_path
+from .ppocr_onnx.tools.infer import predict_det
+
+MODELS = {
+    "det": "en_PP-OCRv3_det_infer.onnx",
+    "rec": "en_PP-OCRv3_rec_infer.onnx",
+}
+# per channel QDQ quantization needs DequantizeLinear with an axis
+MIN_STATIC_OPSET = 13
+IMAGE_SUFFIXES = [".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff"]
+
+
+def load_images(image_dir: Path) -> list[np.ndarray]:
+    """
+    Load the RGB images of a directory, sorted by file name.
+    """
+    images = []
+    for path in sorted(Path(image_dir).iterdir()):
+        if path.suffix.lower() in IMAGE_SUFFIXES:
+            images.append(cv2.cvtColor(cv2.imread(str(path)), cv2.COLOR_BGR2RGB))
+    return images
+
+
+class _OCRCalibrationReader(CalibrationDataReader):
+    """
+    Feed the inputs the FP32 pipeline builds for the calibration images to
+    the static quantizer, so that the activation ranges match what the
+    models see in production.
+    """
+
+    def __init__(self, ocr_model: OCRModel, images: list[np.ndarray], model: str):
+        self.inputs = iter(self._inputs(ocr_model.paddleocr, images, model))
+
+    def _inputs(self, paddleocr, images, model):
+        if model == "det":
+            detector = paddleocr.text_detector
+            for image in images:
+                img, _ = predict_det.transform({"image": image}, detector.preprocess_op)
+                yield {detector.input_tensor.name: img[np.newaxis]}
+            return
+        recognizer = paddleocr.text_recognizer
+        _, imgH, imgW = recognizer.rec_image_shape
+        for image in images:
+            _, img_crop_list, _ = paddleocr.detect(image)
+            for img_crop in img_crop_list:
+                h, w = img_crop.shape[:2]
+                norm_img = recognizer.resize_norm_img(img_crop, max(imgW / imgH, w / h))
+                yield {recognizer.input_tensor.name: norm_img[np.newaxis]}
+
+    def get_next(self):
+        return next(self.inputs, None)
+
+
+def quantize_model(
+    model_path: Path,
+    output_path: Path,
+    mode: str = "dynamic",
+    calibration_reader: CalibrationDataReader = None,
+) -> Path:
+    """
+    Quantize an ONNX model to INT8.
+
+    Parameters
+    ----------
+    model_path : Path
+        Path to the FP32 model.
+    output_path : Path
+        Path of the quantized model.
+    mode : str, optional
+        "dynamic" (weights only, activations are quantized on the fly) or
+        "static" (weights and activations, needs `calibration_reader`), by
+        default "dynamic"
+    calibration_reader : CalibrationDataReader, optional
+        Model inputs used to calibrate the activation ranges in static mode.
+
+    Returns
+    -------
+    Path
+        Path of the quantized model.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # shape inference and constant folding give the quantizer more
+        # tensors with known ranges
+        preprocessed = Path(tmp_dir) / model_path.name
+        quant_pre_process(str(model_path), str(preprocessed), skip_symbolic_shape=True)
+        if mode == "static":
+            # the PaddleOCR models are exported with opset 10 / 11
+            model = onnx.load(str(preprocessed))
+            if model.opset_import[0].version < MIN_STATIC_OPSET:
+                model = version_converter.convert_version(model, MIN_STATIC_OPSET)
+                onnx.save(model, str(preprocessed))
+        if mode == "dynamic":
+            # the CPU ConvInteger kernel only takes unsigned weights
+            quantize_dynamic(
+                str(preprocessed), str(output_path), weight_type=QuantType.QUInt8
+            )
+        elif mode == "static":
+            if calibration_reader is None:
+                raise ValueError("static quantization needs calibration data")
+            quantize_static(
+                str(preprocessed),
+                str(output_path),
+                calibration_reader,
+                quant_format=QuantFormat.QDQ,
+                per_channel=True,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+            )
+        else:
+            raise ValueError(f"Unknown quantization mode: {mode}")
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize the PaddleOCR models to INT8")
+    parser.add_argument("--model_root_dir", type=Path, default=Path("models/paddle-ocr"))
+    parser.add_argument("--mode", choices=["dynamic", "static"], default="dynamic")
+    parser.add_argument(
+        "--calibration_dir",
+        type=Path,
+        default=None,
+        help="Directory of page or block images used to calibrate static quantization",
+    )
+    parser.add_argument("--models", nargs="+", choices=list(MODELS), default=list(MODELS))
+    args = parser.parse_args()
+
+    ocr_model, images = None, None
+    if args.mode == "static":
+        if args.calibration_dir is None:
+            parser.error("--calibration_dir is required for static quantization")
+        images = load_images(args.calibration_dir)
+        ocr_model = OCRModel(args.model_root_dir, device="cpu")
+
+    for model in args.models:
+        model_path = args.model_root_dir / MODELS[model]
+        if not model_path.exists():
+            print(f"Skipping {model_path}: not found")
+            continue
+        reader = None
+        if args.mode == "static":
+            reader = _OCRCalibrationReader(ocr_model, images, model)
+        output_path = quantize_model(
+            model_path, int8_model_path(model_path), args.mode, reader
+        )
+        print(f"Saved {output_path}")
+
+
+if __name__ == "__main__":
+    main()